@@ -1,9 +1,7 @@
 import uvicorn
 import os
-from dotenv import load_dotenv
-from .main import app
-
-load_dotenv()  # Add parentheses to actually call the function
+import importlib.util
+from .main import app, SHUTDOWN_DRAIN_TIMEOUT  # Also loads .env (utils.env)
 
 if __name__ == "__main__":
     log_level = os.getenv("DEBUG_LEVEL", "info").strip().lower()
@@ -19,9 +17,18 @@ if __name__ == "__main__":
 
     port = int(os.getenv("PORT", "8000"))
 
+    # Prefer the C-accelerated event loop and HTTP parser when installed
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+
     uvicorn.run(
         "src.mqtt_latency_test:app",
         host="0.0.0.0",
         port=port,
         log_level=log_level,
+        loop=loop,
+        http=http,
+        # Bound the wait for open connections, leaving the rest of the
+        # drain to the lifespan shutdown
+        timeout_graceful_shutdown=int(SHUTDOWN_DRAIN_TIMEOUT),
     )
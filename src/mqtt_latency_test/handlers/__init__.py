@@ -1,3 +1,7 @@
-from .messageHandlers import save_message_published, save_message_subscribed
+from .messageHandlers import (
+    save_message_published,
+    save_message_subscribed,
+    handle_webhook,
+)
 
-__all__ = ["save_message_published", "save_message_subscribed"]
+__all__ = ["save_message_published", "save_message_subscribed", "handle_webhook"]
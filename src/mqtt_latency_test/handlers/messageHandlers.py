@@ -1,28 +1,47 @@
 from ..utils import (
     decrypt_message,
     get_ntp_timestamp,
-    create_connection,
-    close_connection,
-    insert_first_case_data,
-    insert_second_case_data,
+    get_storage,
+    split_latency,
+    stage,
+    sequence_tracker,
+    anomaly_detector,
+    SEQUENCE_DROP_DUPLICATES,
 )
+from typing import Optional
 import json
 import logging
+import math
 from datetime import datetime, timezone
 
 logger = logging.getLogger("uvicorn.error")
 
 
-async def save_message_published(payload: str):
+async def save_message_published(
+    payload: str,
+    key_id: Optional[str] = None,
+    metadata: Optional[dict] = None,
+    server_timestamp: Optional[float] = None,
+):
     """
     Saves the published message payload to a database.
 
     Args:
         payload (str): The JSON payload of the published message.
+        key_id (str): Encryption key id from the webhook metadata, if any.
+        metadata (dict): EMQX webhook metadata from get_webhook_metadata().
+        server_timestamp (float): Arrival time to use instead of the current
+            NTP time, e.g. when replaying captured traffic.
     """
 
+    if metadata is None:
+        metadata = {}
+
     try:
-        parsed_payload = decrypt_message(payload)
+        with stage("decrypt"):
+            parsed_payload = decrypt_message(
+                payload, key_id=key_id, client_id=metadata.get("clientid")
+            )
     except Exception as e:
         logger.debug(f"Error processing payload: {e}")
         return {
@@ -72,7 +91,11 @@ async def save_message_published(payload: str):
     server_timestamp_epoch = None
 
     try:
-        server_timestamp_epoch = await get_ntp_timestamp()
+        if server_timestamp is not None:
+            server_timestamp_epoch = server_timestamp
+        else:
+            with stage("ntp"):
+                server_timestamp_epoch = await get_ntp_timestamp()
         server_timestamp_datetime = datetime.fromtimestamp(
             server_timestamp_epoch, tz=timezone.utc
         )
@@ -84,20 +107,32 @@ async def save_message_published(payload: str):
     if server_timestamp_epoch is not None and payload_timestamp_epoch is not None:
         difference = server_timestamp_epoch - payload_timestamp_epoch
 
+    broker_timestamp_epoch = metadata.get("broker_timestamp_epoch")
+
+    sequence = sequence_tracker.observe(
+        "first_case", metadata.get("clientid"), iteration
+    )
+    if sequence != "duplicate":
+        anomaly_detector.observe("first_case", difference)
+
     database_saved = False
     try:
-        conn = create_connection()
-        if conn:
-            database_saved = insert_first_case_data(
-                conn=conn,
-                iteration=iteration,
-                payload_timestamp_iso=payload_timestamp_iso,
-                payload_timestamp_epoch=payload_timestamp_epoch,
-                server_timestamp_iso=server_timestamp_iso,
-                server_timestamp_epoch=server_timestamp_epoch,
-                difference=difference,
-            )
-            close_connection(conn)
+        if sequence == "duplicate" and SEQUENCE_DROP_DUPLICATES:
+            logger.debug(f"Dropping duplicate iteration {iteration}")
+        else:
+            with stage("db"):
+                database_saved = await get_storage().insert_first_case_async(
+                    iteration=iteration,
+                    payload_timestamp_iso=payload_timestamp_iso,
+                    payload_timestamp_epoch=payload_timestamp_epoch,
+                    server_timestamp_iso=server_timestamp_iso,
+                    server_timestamp_epoch=server_timestamp_epoch,
+                    difference=difference,
+                    client=metadata.get("clientid"),
+                    topic=metadata.get("topic"),
+                    qos=metadata.get("qos"),
+                    broker_timestamp_epoch=broker_timestamp_epoch,
+                )
     except Exception as e:
         logger.debug(f"Error saving to database: {e}")
 
@@ -112,6 +147,7 @@ async def save_message_published(payload: str):
         "payload": parsed_payload,
         "server": server_timestamp_data,
         "database_saved": database_saved,
+        "sequence": sequence,
         "latency_data": {
             "iteration": iteration,
             "payload_timestamp_iso": payload_timestamp_iso,
@@ -119,21 +155,41 @@ async def save_message_published(payload: str):
             "server_timestamp_iso": server_timestamp_iso,
             "server_timestamp_epoch": server_timestamp_epoch,
             "difference_seconds": difference,
+            "broker_timestamp_epoch": broker_timestamp_epoch,
+            **split_latency(
+                payload_timestamp_epoch, broker_timestamp_epoch, server_timestamp_epoch
+            ),
         },
+        "metadata": metadata,
     }
 
     return response
 
 
-async def save_message_subscribed(payload: str):
+async def save_message_subscribed(
+    payload: str,
+    key_id: Optional[str] = None,
+    metadata: Optional[dict] = None,
+    server_timestamp: Optional[float] = None,
+):
     """
     Saves the subscribed message payload to a database.
     Args:
         payload (str): The JSON payload of the subscribed message.
+        key_id (str): Encryption key id from the webhook metadata, if any.
+        metadata (dict): EMQX webhook metadata from get_webhook_metadata().
+        server_timestamp (float): Arrival time to use instead of the current
+            NTP time, e.g. when replaying captured traffic.
     """
 
+    if metadata is None:
+        metadata = {}
+
     try:
-        parsed_payload = decrypt_message(payload)
+        with stage("decrypt"):
+            parsed_payload = decrypt_message(
+                payload, key_id=key_id, client_id=metadata.get("clientid")
+            )
     except Exception as e:
         logger.debug(f"Error processing payload: {e}")
         return {
@@ -183,7 +239,11 @@ async def save_message_subscribed(payload: str):
     server_timestamp_epoch = None
 
     try:
-        server_timestamp_epoch = await get_ntp_timestamp()
+        if server_timestamp is not None:
+            server_timestamp_epoch = server_timestamp
+        else:
+            with stage("ntp"):
+                server_timestamp_epoch = await get_ntp_timestamp()
         server_timestamp_datetime = datetime.fromtimestamp(
             server_timestamp_epoch, tz=timezone.utc
         )
@@ -195,17 +255,23 @@ async def save_message_subscribed(payload: str):
     if server_timestamp_epoch is not None and payload_timestamp_epoch is not None:
         difference = server_timestamp_epoch - payload_timestamp_epoch
 
+    sequence = sequence_tracker.observe(
+        "second_case", metadata.get("clientid"), iteration
+    )
+    if sequence != "duplicate":
+        anomaly_detector.observe("second_case", difference)
+
     database_saved = False
     try:
-        conn = create_connection()
-        if conn:
-            database_saved = insert_second_case_data(
-                conn=conn,
-                iteration=iteration,
-                server_timestamp_iso=server_timestamp_iso,
-                server_timestamp_epoch=server_timestamp_epoch,
-            )
-            close_connection(conn)
+        if sequence == "duplicate" and SEQUENCE_DROP_DUPLICATES:
+            logger.debug(f"Dropping duplicate iteration {iteration}")
+        else:
+            with stage("db"):
+                database_saved = await get_storage().insert_second_case_async(
+                    iteration=iteration,
+                    server_timestamp_iso=server_timestamp_iso,
+                    server_timestamp_epoch=server_timestamp_epoch,
+                )
     except Exception as e:
         logger.debug(f"Error saving to database: {e}")
 
@@ -220,6 +286,7 @@ async def save_message_subscribed(payload: str):
         "payload": parsed_payload,
         "server": server_timestamp_data,
         "database_saved": database_saved,
+        "sequence": sequence,
         "latency_data": {
             "iteration": iteration,
             "payload_timestamp_iso": payload_timestamp_iso,
@@ -231,3 +298,111 @@ async def save_message_subscribed(payload: str):
     }
 
     return response
+
+
+def get_key_id(data: dict) -> Optional[str]:
+    """
+    Get the encryption key id from the webhook body, either a top-level
+    "key_id" field or a "kid" MQTT v5 user property.
+    """
+    key_id = data.get("key_id")
+    if key_id:
+        return str(key_id)
+
+    pub_props = data.get("pub_props") or {}
+    user_props = pub_props.get("User-Property") or {}
+    if isinstance(user_props, dict) and user_props.get("kid"):
+        return str(user_props["kid"])
+    return None
+
+
+def _parse_name(data: dict, field: str) -> Optional[str]:
+    """Get a clientid/topic field as a string, or None if it is not one."""
+    value = data.get(field)
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    logger.debug(f"Ignoring invalid webhook {field}: {value!r}")
+    return None
+
+
+def _parse_qos(data: dict) -> Optional[int]:
+    """Get the MQTT QoS level (0, 1 or 2), or None if missing or invalid."""
+    value = data.get("qos")
+    if value is None:
+        return None
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if isinstance(value, int) and not isinstance(value, bool) and value in (0, 1, 2):
+        return value
+    logger.debug(f"Ignoring invalid webhook qos: {value!r}")
+    return None
+
+
+def _parse_broker_epoch(data: dict) -> Optional[float]:
+    """
+    Get the broker receive time in epoch seconds from publish_received_at,
+    falling back to timestamp (both in milliseconds), or None if neither
+    is a positive number.
+    """
+    for field in ("publish_received_at", "timestamp"):
+        value = data.get(field)
+        if value is None:
+            continue
+        try:
+            if isinstance(value, bool):
+                raise ValueError
+            milliseconds = float(value)
+        except (TypeError, ValueError):
+            milliseconds = math.nan
+        if math.isfinite(milliseconds) and milliseconds > 0:
+            return milliseconds / 1000
+        logger.debug(f"Ignoring invalid webhook {field}: {value!r}")
+    return None
+
+
+def get_webhook_metadata(data: dict) -> dict:
+    """
+    Get the EMQX webhook fields kept alongside each message: clientid,
+    topic, qos and the broker receive time (publish_received_at, falling
+    back to timestamp, both in milliseconds) as epoch seconds.
+
+    Invalid fields are logged and stored as None, so bad metadata never
+    costs the latency row itself.
+    """
+    return {
+        "clientid": _parse_name(data, "clientid"),
+        "topic": _parse_name(data, "topic"),
+        "qos": _parse_qos(data),
+        "broker_timestamp_epoch": _parse_broker_epoch(data),
+    }
+
+
+async def handle_webhook(
+    kind: str, body: bytes, server_timestamp: Optional[float] = None
+):
+    """
+    Runs a raw EMQX webhook body through the message pipeline.
+
+    Args:
+        kind (str): "publish" or "subscribe".
+        body (bytes): The raw JSON request body.
+        server_timestamp (float): Arrival time to use instead of the current
+            NTP time, e.g. when replaying captured traffic.
+    """
+
+    with stage("parse"):
+        data = json.loads(body)
+
+    payload = data.get("payload")
+    if not payload:
+        return {"status": "error", "message": "No payload found in request data"}
+
+    handler = save_message_published if kind == "publish" else save_message_subscribed
+    return await handler(
+        payload,
+        key_id=get_key_id(data),
+        metadata=get_webhook_metadata(data),
+        server_timestamp=server_timestamp,
+    )
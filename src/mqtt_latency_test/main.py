@@ -1,60 +1,230 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from .routes import message_router
-from .utils import ntp_sync, initialize_database
+from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from .routes import message_router, admin_router
+from .middleware import (
+    ProfilingMiddleware,
+    IngestFastLane,
+    INGEST_FAST_LANE,
+    AdmissionMiddleware,
+)
+from .utils import (
+    ntp_sync,
+    initialize_database,
+    checkpoint_database,
+    run_maintenance,
+    capture,
+    get_storage,
+    close_storage,
+    async_db,
+    anomaly_detector,
+    ROLLUP_INTERVAL,
+)
+from .utils.profiling import PROFILING_ENABLED
+from .utils.admission import admission
+from .utils.correction import persist_ntp_sample
+from .utils.anomaly import persist_anomaly
 import asyncio
+import os
+import time
 import logging
 
 logger = logging.getLogger("uvicorn.error")
 
-app = FastAPI()
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-app.include_router(message_router)
+# Longest time shutdown waits for in-flight requests and background tasks
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "10"))
 
 
-async def background_ntp_sync():
+async def _wait_for_shutdown(shutdown_requested: asyncio.Event, seconds: float) -> bool:
+    """Sleep for `seconds`; returns True early if shutdown was requested."""
+    try:
+        await asyncio.wait_for(shutdown_requested.wait(), seconds)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+async def background_ntp_sync(shutdown_requested: asyncio.Event):
     """
     Background task to keep NTP synchronized.
     Syncs every 25 seconds to ensure cache stays fresh (cache duration is 30s).
+    The first iteration is the initial sync, so startup does not wait for it.
     """
-    while True:
+    while not shutdown_requested.is_set():
         try:
             await ntp_sync.get_ntp_timestamp()  # This will sync if needed
         except Exception as e:
             logger.debug(f"Background NTP sync failed: {e}")
 
         # Wait 25 seconds before next sync (less than 30s cache duration)
-        await asyncio.sleep(25)
+        if await _wait_for_shutdown(shutdown_requested, 25):
+            break
 
 
-@app.on_event("startup")
-async def startup_event():
+async def background_rollup_maintenance(shutdown_requested: asyncio.Event):
+    """
+    Background task to roll raw latency rows up into minute/hour aggregates
+    and prune expired raw rows. Runs in a worker thread so SQLite I/O does
+    not block the event loop.
+    """
+    while not shutdown_requested.is_set():
+        try:
+            result = await asyncio.to_thread(run_maintenance)
+            if result["rolled_up"] or result["pruned"]:
+                logger.debug(f"Rollup maintenance: {result}")
+        except Exception as e:
+            logger.debug(f"Rollup maintenance failed: {e}")
+
+        if await _wait_for_shutdown(shutdown_requested, ROLLUP_INTERVAL):
+            break
+
+
+async def startup(app: FastAPI):
     """
     Perform initial setup on server startup.
+
+    The first NTP sync starts in the background while the schema is created
+    in a worker thread. Only the schema is awaited, since ingestion needs
+    the tables; GET /ready reports when timestamps are NTP-synced.
+
+    The shutdown_requested and database_ready events are created here and
+    kept on app.state, as asyncio primitives are bound to the event loop
+    that first waits on them and a later start may run on another loop.
+
+    Returns:
+        list: The background tasks started
     """
+    tasks = []
+    shutdown_requested = app.state.shutdown_requested = asyncio.Event()
+    database_ready = app.state.database_ready = asyncio.Event()
+    admission.reset()
     try:
-        # Initialize database and create tables
-        database_initialized = initialize_database()
+        # Keep a history of NTP sync samples for retroactive correction
+        if persist_ntp_sample not in ntp_sync.sync_listeners:
+            ntp_sync.sync_listeners.append(persist_ntp_sample)
+
+        # Record latency anomalies in the anomalies table
+        if persist_anomaly not in anomaly_detector.listeners:
+            anomaly_detector.listeners.append(persist_anomaly)
+
+        # Perform initial NTP sync concurrently with database setup
+        tasks.append(asyncio.create_task(background_ntp_sync(shutdown_requested)))
+
+        # Initialize database and create tables, and open the storage
+        # backend (the mmap log rebuilds its index) before the first request
+        database_initialized, _ = await asyncio.gather(
+            asyncio.to_thread(initialize_database),
+            asyncio.to_thread(get_storage),
+        )
         if database_initialized:
+            database_ready.set()
             logger.debug("Database initialized successfully")
         else:
             logger.debug("Warning: Database initialization failed")
 
-        # Perform initial NTP sync
-        await ntp_sync.get_ntp_timestamp()
-
-        # Start background sync task
-        asyncio.create_task(background_ntp_sync())
+        # Start background tasks
+        tasks.append(
+            asyncio.create_task(background_rollup_maintenance(shutdown_requested))
+        )
 
     except Exception as e:
         logger.debug(f"Startup initialization failed: {e}")
 
+    return tasks
+
+
+async def shutdown(app: FastAPI, tasks: list):
+    """
+    Drain and flush everything on server shutdown.
+
+    New ingestion requests are rejected with 503 while in-flight ones
+    finish, background tasks are stopped and the listeners registered by
+    startup() are removed, then captured traffic and stored rows are
+    flushed and the database is checkpointed. The drain steps share
+    SHUTDOWN_DRAIN_TIMEOUT; flushing always runs.
+    """
+    deadline = time.monotonic() + SHUTDOWN_DRAIN_TIMEOUT
+
+    if not await admission.drain(SHUTDOWN_DRAIN_TIMEOUT):
+        logger.warning(
+            f"Shutdown: {admission.in_flight} ingestion requests still in flight"
+        )
+
+    app.state.shutdown_requested.set()
+    if tasks:
+        _, pending = await asyncio.wait(
+            tasks, timeout=max(deadline - time.monotonic(), 0)
+        )
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    if persist_ntp_sample in ntp_sync.sync_listeners:
+        ntp_sync.sync_listeners.remove(persist_ntp_sample)
+    if persist_anomaly in anomaly_detector.listeners:
+        anomaly_detector.listeners.remove(persist_anomaly)
+
+    try:
+        await asyncio.to_thread(capture.close)
+        await asyncio.to_thread(close_storage)
+        await asyncio.to_thread(async_db.close)
+        await asyncio.to_thread(checkpoint_database)
+    except Exception as e:
+        logger.debug(f"Shutdown flush failed: {e}")
+
+    logger.debug("Shutdown complete")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = await startup(app)
+    yield
+    await shutdown(app, tasks)
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+# Added after CORS so ingestion requests skip it (EMQX does not need CORS)
+if INGEST_FAST_LANE:
+    app.add_middleware(IngestFastLane)
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+# Added last, so it is the outermost middleware. Always installed, since
+# it also rejects ingestion while draining for shutdown.
+app.add_middleware(AdmissionMiddleware)
+app.include_router(message_router)
+app.include_router(admin_router)
+
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to the MQTT Latency Test API!"}
+
+
+@app.get("/ready")
+async def ready(request: Request):
+    """
+    Readiness check: 200 once the database is initialized and timestamps
+    come from a recent NTP sync, 503 until then (or while draining).
+    """
+    database_ready = getattr(request.app.state, "database_ready", None)
+    checks = {
+        "database": database_ready is not None and database_ready.is_set(),
+        "ntp": ntp_sync.is_trusted(),
+        "accepting": not admission.draining,
+    }
+    is_ready = all(checks.values())
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={
+            "status": "ready" if is_ready else "not_ready",
+            "checks": checks,
+            "ntp": ntp_sync.get_cache_status(),
+        },
+    )
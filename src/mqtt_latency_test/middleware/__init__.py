@@ -0,0 +1,10 @@
+from .profilingMiddleware import ProfilingMiddleware
+from .ingestMiddleware import IngestFastLane, INGEST_FAST_LANE
+from .admissionMiddleware import AdmissionMiddleware
+
+__all__ = [
+    "ProfilingMiddleware",
+    "IngestFastLane",
+    "INGEST_FAST_LANE",
+    "AdmissionMiddleware",
+]
@@ -0,0 +1,56 @@
+from ..utils.admission import (
+    admission,
+    ADMISSION_REJECT_STATUS,
+    ADMISSION_RETRY_AFTER,
+)
+from ..utils.cache import encode_json
+from .ingestMiddleware import INGEST_PATHS
+
+_REJECT_BODY = encode_json(
+    {"status": "error", "message": "Server overloaded, retry later"}
+)
+_REJECT_HEADERS = [
+    (b"content-type", b"application/json"),
+    (b"content-length", str(len(_REJECT_BODY)).encode("latin-1")),
+    (b"retry-after", str(ADMISSION_RETRY_AFTER).encode("latin-1")),
+]
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying admission control to the ingestion endpoints.
+
+    Requests beyond the in-flight limit wait in a bounded queue; once the
+    queue is full or the wait times out they are rejected with
+    ADMISSION_REJECT_STATUS and a Retry-After header, before the body is
+    read. Installed as the outermost middleware so shed requests cost as
+    little as possible.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in INGEST_PATHS
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        if not await admission.acquire():
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": ADMISSION_REJECT_STATUS,
+                    "headers": _REJECT_HEADERS,
+                }
+            )
+            await send({"type": "http.response.body", "body": _REJECT_BODY})
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release()
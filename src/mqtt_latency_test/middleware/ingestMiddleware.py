@@ -0,0 +1,99 @@
+import os
+import logging
+from urllib.parse import parse_qs
+
+from ..handlers import handle_webhook
+from ..utils import capture
+from ..utils.cache import encode_json
+
+logger = logging.getLogger("uvicorn.error")
+
+# Serve the ingestion endpoints from the fast lane
+INGEST_FAST_LANE = os.getenv("INGEST_FAST_LANE", "true").strip().lower() in (
+    "1",
+    "true",
+    "yes",
+)
+# Reply with the full handler response instead of a short acknowledgement;
+# a single request can opt in with ?verbose=true
+INGEST_VERBOSE_RESPONSE = os.getenv(
+    "INGEST_VERBOSE_RESPONSE", "false"
+).strip().lower() in ("1", "true", "yes")
+
+INGEST_PATHS = {"/message/publish": "publish", "/message/subscribe": "subscribe"}
+
+_ACKS = {
+    saved: encode_json({"status": "success", "database_saved": saved})
+    for saved in (True, False)
+}
+
+
+def _headers(body: bytes) -> list:
+    return [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode("latin-1")),
+    ]
+
+
+def _wants_verbose(scope) -> bool:
+    query = scope.get("query_string")
+    if not query:
+        return INGEST_VERBOSE_RESPONSE
+    values = parse_qs(query.decode("latin-1")).get("verbose")
+    if not values:
+        return INGEST_VERBOSE_RESPONSE
+    return values[-1].strip().lower() in ("1", "true", "yes")
+
+
+class IngestFastLane:
+    """
+    ASGI middleware serving POST /message/publish and /message/subscribe
+    without FastAPI routing, request objects or response serialization.
+
+    The raw body is captured and handed to handle_webhook(), and the reply
+    is a pre-encoded acknowledgement unless the verbose response was
+    requested. All other requests pass through to the wrapped app.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        kind = None
+        if scope["type"] == "http" and scope["method"] == "POST":
+            kind = INGEST_PATHS.get(scope["path"])
+        if kind is None:
+            await self.app(scope, receive, send)
+            return
+
+        arrival_ns = capture.arrival_ns()
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+        capture.record(kind, body, arrival_ns)
+
+        try:
+            result = await handle_webhook(kind, body)
+        except Exception as e:
+            logger.debug(f"Error processing request: {e}")
+            result = {"status": "error", "message": str(e)}
+
+        if _wants_verbose(scope) or result.get("status") != "success":
+            response = encode_json(result)
+        else:
+            response = _ACKS[bool(result.get("database_saved"))]
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": _headers(response),
+            }
+        )
+        await send({"type": "http.response.body", "body": response})
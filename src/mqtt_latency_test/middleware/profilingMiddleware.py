@@ -0,0 +1,40 @@
+import time
+from ..utils.profiling import start_request_timing, finish_request_timing
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware recording total and per-stage timings of each HTTP
+    request into the profiling ring buffer. Only installed when
+    PROFILING_ENABLED is set.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        token, timings = start_request_timing()
+        start = time.perf_counter_ns()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finish_request_timing(
+                token,
+                timings,
+                scope["method"],
+                scope["path"],
+                status,
+                time.perf_counter_ns() - start,
+            )
@@ -0,0 +1,94 @@
+import argparse
+import asyncio
+import time
+from .handlers import handle_webhook
+from .utils import initialize_database, async_db
+from .utils.capture import list_segments, read_segment
+
+
+async def replay(
+    directory: str,
+    paced: bool = False,
+    speed: float = 1.0,
+    recorded_time: bool = False,
+) -> dict:
+    """
+    Stream captured webhook traffic through the message pipeline.
+
+    Args:
+        directory: Capture directory (CAPTURE_DIR of the recording server)
+        paced: Reproduce the original inter-arrival gaps instead of running
+            at full speed
+        speed: Pacing speed-up factor, e.g. 2.0 replays twice as fast
+        recorded_time: Use the recorded arrival time as the server timestamp
+            instead of the current NTP time
+
+    Returns:
+        dict: Replayed/failed counts and throughput
+    """
+
+    replayed = 0
+    failed = 0
+    first_arrival_ns = None
+    started = time.perf_counter()
+
+    for path in list_segments(directory):
+        for arrival_ns, kind, body in read_segment(path):
+            if paced:
+                if first_arrival_ns is None:
+                    first_arrival_ns = arrival_ns
+                due = (arrival_ns - first_arrival_ns) / 1e9 / speed
+                delay = due - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            try:
+                result = await handle_webhook(
+                    kind,
+                    body,
+                    server_timestamp=arrival_ns / 1e9 if recorded_time else None,
+                )
+                if result.get("status") != "success":
+                    failed += 1
+            except Exception:
+                failed += 1
+            replayed += 1
+
+    elapsed = time.perf_counter() - started
+    return {
+        "replayed": replayed,
+        "failed": failed,
+        "elapsed_seconds": elapsed,
+        "messages_per_second": replayed / elapsed if elapsed > 0 else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay captured webhook traffic through the message pipeline."
+    )
+    parser.add_argument("directory", help="Capture directory")
+    parser.add_argument(
+        "--paced", action="store_true", help="Keep the original pacing"
+    )
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="Pacing speed-up factor"
+    )
+    parser.add_argument(
+        "--recorded-time",
+        action="store_true",
+        help="Use recorded arrival times as server timestamps",
+    )
+    args = parser.parse_args()
+
+    initialize_database()
+    result = asyncio.run(
+        replay(
+            args.directory,
+            paced=args.paced,
+            speed=args.speed,
+            recorded_time=args.recorded_time,
+        )
+    )
+    async_db.close()
+    print(result)
@@ -1,3 +1,4 @@
 from .messageRoutes import router as message_router
+from .adminRoutes import router as admin_router
 
-__all__ = ["message_router"]
+__all__ = ["message_router", "admin_router"]
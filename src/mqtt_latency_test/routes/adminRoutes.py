@@ -0,0 +1,120 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from ..utils.profiling import (
+    PROFILING_ENABLED,
+    PROFILE_MAX_SECONDS,
+    request_timings,
+    summarize_timings,
+    sample_profile,
+)
+from ..utils import keyring, capture
+from ..utils.admission import admission
+from typing import Optional
+import asyncio
+import hmac
+import os
+import logging
+
+logger = logging.getLogger("uvicorn.error")
+
+# Admin endpoints require a matching X-Admin-Token header, and are
+# refused altogether when no token is configured
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+async def verify_admin_token(x_admin_token: Optional[str] = Header(default=None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(
+            status_code=403, detail="Admin endpoints are disabled, set ADMIN_TOKEN"
+        )
+    if not x_admin_token or not hmac.compare_digest(
+        x_admin_token.encode(), ADMIN_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+def require_profiling():
+    """Hide the profiling endpoints unless PROFILING_ENABLED is set."""
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+router = APIRouter(
+    prefix="/admin", tags=["admin"], dependencies=[Depends(verify_admin_token)]
+)
+
+
+@router.get("/timings", dependencies=[Depends(require_profiling)])
+async def get_request_timings(limit: int = 100):
+    """
+    Get per-stage request timings recorded by the profiling middleware.
+    """
+    recent = list(request_timings)[-limit:] if limit > 0 else []
+    return {
+        "status": "success",
+        "summary": summarize_timings(),
+        "recent": recent,
+    }
+
+
+@router.get(
+    "/profile",
+    response_class=PlainTextResponse,
+    dependencies=[Depends(require_profiling)],
+)
+async def get_sampling_profile(seconds: float = 10.0, interval: float = 0.005):
+    """
+    Sample the running process for `seconds` and return collapsed stacks,
+    ready for flamegraph.pl or speedscope.
+    """
+    if seconds <= 0 or seconds > PROFILE_MAX_SECONDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"seconds must be between 0 and {PROFILE_MAX_SECONDS}",
+        )
+
+    collapsed = await asyncio.to_thread(sample_profile, seconds, interval)
+    if collapsed is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+    return PlainTextResponse(
+        collapsed,
+        headers={"Content-Disposition": 'attachment; filename="profile.folded"'},
+    )
+
+
+@router.get("/keys")
+async def get_keyring_status():
+    """
+    Get the loaded encryption key ids (never the keys themselves).
+    """
+    return {"status": "success", "keyring": keyring.status()}
+
+
+@router.post("/keys/reload")
+async def reload_keyring():
+    """
+    Reload encryption keys from the environment, .env and MQTT_KEYRING_FILE.
+    """
+    try:
+        keyring.reload()
+        return {"status": "success", "keyring": keyring.status()}
+    except Exception as e:
+        logger.debug(f"Keyring reload failed: {e}")
+        return {"status": "error", "message": str(e)}
+
+
+@router.get("/capture")
+async def get_capture_status():
+    """
+    Get the raw webhook traffic capture status.
+    """
+    return {"status": "success", "capture": capture.status()}
+
+
+@router.get("/admission")
+async def get_admission_status():
+    """
+    Get in-flight, queued and shed counts of the ingestion admission control.
+    """
+    return {"status": "success", "admission": admission.status()}
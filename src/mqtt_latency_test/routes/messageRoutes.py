@@ -1,14 +1,21 @@
-from fastapi import APIRouter, Request
-from ..handlers import save_message_published, save_message_subscribed
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import StreamingResponse
+from ..handlers import handle_webhook
 from ..utils import (
     ntp_sync,
     get_ntp_timestamp,
     get_ntp_datetime,
-    create_connection,
-    close_connection,
+    async_db,
+    get_storage,
+    response_cache,
+    capture,
+    sequence_tracker,
+    anomaly_detector,
+    fetch_anomalies,
 )
+from typing import Awaitable, Callable, Hashable, Optional
+import asyncio
 import json
-import sqlite3
 import logging
 
 logger = logging.getLogger("uvicorn.error")
@@ -16,18 +23,46 @@ logger = logging.getLogger("uvicorn.error")
 router = APIRouter(prefix="/message", tags=["message"])
 
 
+async def _cached_response(
+    request: Request,
+    name: str,
+    get_version: Callable[[], Awaitable[Hashable]],
+    build: Callable[[], Awaitable[dict]],
+) -> Response:
+    """
+    Serve a JSON body from the response cache with ETag revalidation.
+
+    The cache key is the endpoint name plus its query parameters. Only
+    successful bodies are cached; a matching If-None-Match gets a 304.
+    """
+    key = (name, tuple(sorted(request.query_params.multi_items())))
+    entry = await response_cache.get_or_build(
+        key,
+        get_version,
+        build,
+        cacheable=lambda content: content.get("status") == "success",
+    )
+
+    headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if entry.etag:
+        headers["ETag"] = entry.etag
+        if entry.matches(request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+
+    encoding, body = await entry.negotiate(request.headers.get("accept-encoding"))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 @router.post("/publish")
 async def message_published(request: Request):
     try:
-        data = await request.json()
-        # print("Received JSON data:")
-        # print(json.dumps(data, indent=2))
-
-        payload = data.get("payload")
-        if not payload:
-            return {"status": "error", "message": "No payload found in request data"}
+        arrival_ns = capture.arrival_ns()
+        body = await request.body()
+        capture.record("publish", body, arrival_ns)
 
-        result = await save_message_published(payload)
+        result = await handle_webhook("publish", body)
         return result
     except Exception as e:
         logger.debug(f"Error processing request: {e}")
@@ -37,13 +72,11 @@ async def message_published(request: Request):
 @router.post("/subscribe")
 async def message_subscribed(request: Request):
     try:
-        data = await request.json()
+        arrival_ns = capture.arrival_ns()
+        body = await request.body()
+        capture.record("subscribe", body, arrival_ns)
 
-        payload = data.get("payload")
-        if not payload:
-            return {"status": "error", "message": "No payload found in request data"}
-
-        result = await save_message_subscribed(payload)
+        result = await handle_webhook("subscribe", body)
         return result
     except Exception as e:
         logger.debug(f"Error processing request: {e}")
@@ -55,6 +88,7 @@ async def get_ntp_status():
     """
     Get NTP synchronization status and current NTP time.
     Useful for debugging and monitoring NTP sync health.
+    Not cached: the current time, cache age and status change per request.
     """
     try:
         cache_status = ntp_sync.get_cache_status()
@@ -99,43 +133,19 @@ async def get_ntp_status():
 
 
 @router.get("/data")
-async def get_latency_data():
+async def get_latency_data(request: Request):
     """
-    Get all latency test data from the first_case table.
+    Get all latency test data from the first_case storage.
+    Cached until a row is ingested or pruned.
     """
+    return await _cached_response(
+        request, "data", get_storage().data_version_async, _build_latency_data
+    )
+
+
+async def _build_latency_data() -> dict:
     try:
-        conn = create_connection()
-        if not conn:
-            return {"status": "error", "message": "Failed to connect to database"}
-
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT id, iteration, payload_timestamp_iso, payload_timestamp_epoch, 
-                   server_timestamp_iso, server_timestamp_epoch, difference, created_at
-            FROM first_case 
-            ORDER BY created_at DESC
-        """
-        )
-
-        rows = cursor.fetchall()
-        close_connection(conn)
-
-        # Convert to list of dictionaries
-        data = []
-        for row in rows:
-            data.append(
-                {
-                    "id": row[0],
-                    "iteration": row[1],
-                    "payload_timestamp_iso": row[2],
-                    "payload_timestamp_epoch": row[3],
-                    "server_timestamp_iso": row[4],
-                    "server_timestamp_epoch": row[5],
-                    "difference_seconds": row[6],
-                    "created_at": row[7],
-                }
-            )
+        data = await get_storage().fetch_first_case_async()
 
         return {
             "status": "success",
@@ -146,3 +156,115 @@ async def get_latency_data():
     except Exception as e:
         logger.debug(f"Error retrieving data: {e}")
         return {"status": "error", "message": str(e)}
+
+
+@router.get("/data/stream")
+async def stream_latency_data():
+    """
+    Stream all first_case rows, newest first, as newline-delimited JSON.
+    Rows are read in batches, so memory stays flat however large the
+    table is.
+    """
+
+    async def rows():
+        try:
+            async for batch in get_storage().stream_first_case_async():
+                yield "".join(json.dumps(row) + "\n" for row in batch)
+        except Exception as e:
+            logger.debug(f"Error streaming data: {e}")
+            yield json.dumps({"status": "error", "message": str(e)}) + "\n"
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+
+@router.get("/stats")
+async def get_latency_statistics(
+    start: Optional[float] = None, end: Optional[float] = None
+):
+    """
+    Get latency statistics for first_case rows between `start` and `end`
+    (epoch seconds). Long ranges are served from the rollup tables.
+    """
+    try:
+        stats = await get_storage().latency_stats_async(start=start, end=end)
+
+        return {"status": "success", "stats": stats}
+
+    except Exception as e:
+        logger.debug(f"Error retrieving stats: {e}")
+        return {"status": "error", "message": str(e)}
+
+
+@router.get("/stats/clients")
+async def get_client_statistics(
+    start: Optional[float] = None, end: Optional[float] = None
+):
+    """
+    Get per-client latency statistics, split into device-to-broker and
+    broker-to-webhook segments, for rows between `start` and `end`.
+    """
+    try:
+        clients = await get_storage().client_stats_async(start=start, end=end)
+
+        return {"status": "success", "clients": clients}
+
+    except Exception as e:
+        logger.debug(f"Error retrieving client stats: {e}")
+        return {"status": "error", "message": str(e)}
+
+
+@router.get("/sequence")
+async def get_sequence_statistics():
+    """
+    Get duplicate, loss and reordering counts per run, client and case,
+    from the in-memory sequence tracker.
+    """
+    try:
+        return {"status": "success", **sequence_tracker.stats()}
+
+    except Exception as e:
+        logger.debug(f"Error retrieving sequence stats: {e}")
+        return {"status": "error", "message": str(e)}
+
+
+@router.get("/anomalies")
+async def get_anomalies(limit: int = 100):
+    """
+    Get the state of the latency anomaly detectors and the most recent
+    anomaly events from the anomalies table.
+    """
+    try:
+        events = await async_db.read(fetch_anomalies, limit=limit)
+
+        return {"status": "success", **anomaly_detector.status(), "events": events}
+
+    except Exception as e:
+        logger.debug(f"Error retrieving anomalies: {e}")
+        return {"status": "error", "message": str(e)}
+
+
+@router.get("/anomalies/stream")
+async def stream_anomalies(request: Request):
+    """
+    Stream latency anomaly events as Server-Sent Events.
+    """
+
+    async def events():
+        subscriber = anomaly_detector.subscribe()
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscriber.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Keep idle connections open through proxies
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: anomaly\ndata: {json.dumps(event)}\n\n"
+        finally:
+            anomaly_detector.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
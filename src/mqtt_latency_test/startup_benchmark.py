@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+APP_MODULE = f"{__package__ or 'src.mqtt_latency_test'}.main"
+
+# "import time: <self us> | <cumulative us> | <indent><module>"
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+# Run in a fresh interpreter: import the app, enter its lifespan (startup),
+# then wait for the first NTP sync, timing each step
+_STARTUP_SNIPPET = """
+import asyncio, json, os, time
+started = time.perf_counter()
+from {module} import app, lifespan
+from {package}.utils import ntp_sync
+imported = time.perf_counter()
+
+async def main():
+    async with lifespan(app):
+        started_up = time.perf_counter()
+        ntp_trusted = None
+        deadline = started_up + {ntp_wait}
+        while time.perf_counter() < deadline:
+            if ntp_sync.is_trusted():
+                ntp_trusted = time.perf_counter() - started
+                break
+            await asyncio.sleep(0.01)
+        print(json.dumps({{
+            "import_seconds": imported - started,
+            "startup_seconds": started_up - started,
+            "ntp_trusted_seconds": ntp_trusted,
+            "database_ready": app.state.database_ready.is_set(),
+        }}), flush=True)
+        # Skip shutdown: it would wait for an in-flight NTP request
+        os._exit(0)
+
+asyncio.run(main())
+"""
+
+
+def parse_importtime(stderr: str) -> list:
+    """
+    Parse `python -X importtime` output.
+
+    Args:
+        stderr: Standard error of the interpreter
+
+    Returns:
+        list: (module, self_us, cumulative_us, depth) tuples, in output order
+    """
+    rows = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append(
+                (module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2)
+            )
+    return rows
+
+
+def measure_imports(runs: int = 5, module: str = APP_MODULE) -> dict:
+    """
+    Import the app in fresh interpreters with `-X importtime`.
+
+    Args:
+        runs: Number of interpreters to start
+        module: Module to import
+
+    Returns:
+        dict: Median total import time and per-package self times
+    """
+    totals = []
+    by_package = defaultdict(list)
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        rows = parse_importtime(result.stderr)
+        totals.append(sum(self_us for _, self_us, _, _ in rows))
+
+        packages = defaultdict(int)
+        for name, self_us, _, _ in rows:
+            packages[name.split(".")[0]] += self_us
+        for name, self_us in packages.items():
+            by_package[name].append(self_us)
+
+    return {
+        "runs": runs,
+        "total_ms": statistics.median(totals) / 1000,
+        "packages_ms": {
+            name: statistics.median(values + [0] * (runs - len(values))) / 1000
+            for name, values in by_package.items()
+        },
+    }
+
+
+def measure_startup(runs: int = 5, ntp_wait: float = 5.0) -> dict:
+    """
+    Time app import, lifespan startup and the first NTP sync in fresh
+    interpreters, against a throwaway database.
+
+    Args:
+        runs: Number of interpreters to start
+        ntp_wait: Longest time to wait for the first NTP sync
+
+    Returns:
+        dict: Median seconds to import, to finish startup and to trust NTP
+    """
+    samples = []
+    snippet = _STARTUP_SNIPPET.format(
+        module=APP_MODULE, package=APP_MODULE.rsplit(".", 1)[0], ntp_wait=ntp_wait
+    )
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(
+                os.environ,
+                DATABASE_PATH=os.path.join(directory, "database.db"),
+                MMAP_LOG_DIR=os.path.join(directory, "mmap_log"),
+                CAPTURE_DIR="",
+            )
+            result = subprocess.run(
+                [sys.executable, "-c", snippet],
+                capture_output=True,
+                text=True,
+                env=env,
+                check=True,
+            )
+            samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    def median(key):
+        values = [s[key] for s in samples if s[key] is not None]
+        return statistics.median(values) if values else None
+
+    return {
+        "runs": runs,
+        "import_seconds": median("import_seconds"),
+        "startup_seconds": median("startup_seconds"),
+        "ntp_trusted_seconds": median("ntp_trusted_seconds"),
+        "database_ready": all(s["database_ready"] for s in samples),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure cold start: import time per package and time to ready."
+    )
+    parser.add_argument(
+        "--runs", type=int, default=5, help="Fresh interpreters per measurement"
+    )
+    parser.add_argument(
+        "--top", type=int, default=15, help="Packages to list by import time"
+    )
+    parser.add_argument(
+        "--ntp-wait",
+        type=float,
+        default=5.0,
+        help="Longest time to wait for the first NTP sync",
+    )
+    parser.add_argument(
+        "--imports-only", action="store_true", help="Skip the startup timing"
+    )
+    args = parser.parse_args()
+
+    imports = measure_imports(runs=args.runs)
+    print(f"Import of {APP_MODULE}: {imports['total_ms']:.1f} ms (median)")
+    top = sorted(imports["packages_ms"].items(), key=lambda item: -item[1])
+    for name, ms in top[: args.top]:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    if not args.imports_only:
+        print(measure_startup(runs=args.runs, ntp_wait=args.ntp_wait))
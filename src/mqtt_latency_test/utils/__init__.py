@@ -1,15 +1,61 @@
-from .decrypt import decrypt_message
-from .ntp import get_ntp_timestamp, get_ntp_datetime, ntp_sync
-from .database import (
-    create_connection,
-    close_connection,
-    insert_first_case_data,
-    insert_second_case_data,
-    initialize_database,
-)
+import importlib
+
+from . import env  # noqa: F401  (loads .env before any settings are read)
+
+# `capture` is shadowed by its own submodule once that is imported (e.g. by
+# replay.py), so it is bound eagerly instead of through __getattr__
+from .capture import capture
+
+# Exported name -> submodule. Submodules are imported on first access, so
+# importing the package does not pull in NumPy, pycryptodome and friends
+# until something actually needs them.
+_EXPORTS = {
+    "decrypt_message": "decrypt",
+    "keyring": "decrypt",
+    "get_ntp_timestamp": "ntp",
+    "get_ntp_datetime": "ntp",
+    "ntp_sync": "ntp",
+    "create_connection": "database",
+    "close_connection": "database",
+    "insert_first_case_data": "database",
+    "insert_second_case_data": "database",
+    "initialize_database": "database",
+    "checkpoint_database": "database",
+    "fetch_first_case_data": "database",
+    "split_latency": "database",
+    "fetch_client_stats": "database",
+    "fetch_anomalies": "database",
+    "async_db": "async_database",
+    "response_cache": "cache",
+    "stage": "profiling",
+    "get_storage": "storage",
+    "close_storage": "storage",
+    "anomaly_detector": "anomaly",
+    "sequence_tracker": "sequence",
+    "SEQUENCE_DROP_DUPLICATES": "sequence",
+    "run_maintenance": "rollup",
+    "get_latency_stats": "rollup",
+    "ROLLUP_INTERVAL": "rollup",
+}
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    # Cache on the package so later lookups skip __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
+
 
 __all__ = [
     "decrypt_message",
+    "keyring",
     "get_ntp_timestamp",
     "get_ntp_datetime",
     "ntp_sync",
@@ -18,4 +64,21 @@ __all__ = [
     "insert_first_case_data",
     "insert_second_case_data",
     "initialize_database",
+    "checkpoint_database",
+    "fetch_first_case_data",
+    "split_latency",
+    "fetch_client_stats",
+    "fetch_anomalies",
+    "async_db",
+    "response_cache",
+    "stage",
+    "capture",
+    "get_storage",
+    "close_storage",
+    "anomaly_detector",
+    "sequence_tracker",
+    "SEQUENCE_DROP_DUPLICATES",
+    "run_maintenance",
+    "get_latency_stats",
+    "ROLLUP_INTERVAL",
 ]
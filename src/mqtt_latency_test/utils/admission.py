@@ -0,0 +1,149 @@
+import asyncio
+import os
+import logging
+
+logger = logging.getLogger("uvicorn.error")
+
+# Ingestion requests processed concurrently (0 disables admission control)
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "64"))
+# Requests allowed to wait for a slot; further requests are rejected at once
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "256"))
+# Longest a request may wait for a slot before it is rejected (seconds)
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "1.0"))
+# Status code and Retry-After (seconds) of rejected requests
+ADMISSION_REJECT_STATUS = int(os.getenv("ADMISSION_REJECT_STATUS", "503"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+
+class AdmissionLimiter:
+    """
+    Bounded in-flight count with a bounded, time-limited wait queue.
+
+    A request either gets a slot right away, waits for one (at most
+    `max_queue` waiters, each for at most `queue_timeout` seconds), or is
+    shed. Shedding early keeps latency bounded during bursts instead of
+    letting work pile up until the broker times out and retries.
+
+    While draining for shutdown every new request is shed, and drain()
+    waits for the admitted ones to finish. In-flight requests are counted
+    even when the limit is disabled.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+    ):
+        self.enabled = max_in_flight > 0
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.shed_draining = 0
+        self.peak_waiting = 0
+        self.draining = False
+        self._slots = asyncio.Semaphore(max(max_in_flight, 1))
+        self._idle = asyncio.Event()
+
+    def reset(self) -> None:
+        """
+        Admit requests again with fresh asyncio primitives, on server start
+        (possibly on a new event loop). Counters are kept.
+        """
+        self.draining = False
+        self._slots = asyncio.Semaphore(max(self.max_in_flight, 1))
+        self._idle = asyncio.Event()
+
+    async def acquire(self) -> bool:
+        """
+        Wait for a processing slot.
+
+        Returns:
+            bool: True if admitted (call release() when done), False if shed
+        """
+        if self.draining:
+            self.shed_draining += 1
+            return False
+
+        if self.enabled:
+            if not self._slots.locked():
+                await self._slots.acquire()
+            else:
+                if self.waiting >= self.max_queue:
+                    self.shed_queue_full += 1
+                    return False
+
+                self.waiting += 1
+                self.queued += 1
+                self.peak_waiting = max(self.peak_waiting, self.waiting)
+                try:
+                    await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+                except asyncio.TimeoutError:
+                    self.shed_timeout += 1
+                    return False
+                finally:
+                    self.waiting -= 1
+
+                if self.draining:
+                    # Shutdown started while this request was queued
+                    self._slots.release()
+                    self.shed_draining += 1
+                    return False
+
+        self.in_flight += 1
+        self.admitted += 1
+        return True
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        if self.enabled:
+            self._slots.release()
+        if self.in_flight == 0:
+            self._idle.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """
+        Stop admitting requests and wait for the in-flight ones.
+
+        Args:
+            timeout: Longest time to wait, in seconds
+
+        Returns:
+            bool: True if all in-flight requests finished in time
+        """
+        self.draining = True
+        if self.in_flight == 0:
+            return True
+        self._idle.clear()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return self.in_flight == 0
+        return True
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "peak_waiting": self.peak_waiting,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed_queue_full + self.shed_timeout + self.shed_draining,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+            "shed_draining": self.shed_draining,
+            "draining": self.draining,
+        }
+
+
+admission = AdmissionLimiter()
@@ -0,0 +1,225 @@
+import asyncio
+import math
+import os
+import time
+import logging
+from collections import deque
+from typing import Callable, List, Optional
+
+from .database import insert_anomaly
+from .async_database import async_db
+
+logger = logging.getLogger("uvicorn.error")
+
+# Samples used to establish a baseline before detection starts
+ANOMALY_WARMUP = int(os.getenv("ANOMALY_WARMUP", "100"))
+# EWMA smoothing factor
+ANOMALY_EWMA_ALPHA = float(os.getenv("ANOMALY_EWMA_ALPHA", "0.05"))
+# CUSUM slack and decision threshold, in baseline standard deviations
+ANOMALY_CUSUM_K = float(os.getenv("ANOMALY_CUSUM_K", "0.5"))
+ANOMALY_CUSUM_H = float(os.getenv("ANOMALY_CUSUM_H", "8"))
+# Single samples further than this many standard deviations are spikes
+ANOMALY_SPIKE_Z = float(os.getenv("ANOMALY_SPIKE_Z", "6"))
+# Samples to wait after a spike event before reporting another one
+ANOMALY_SPIKE_COOLDOWN = int(os.getenv("ANOMALY_SPIKE_COOLDOWN", "100"))
+# Floor for the baseline standard deviation (seconds), so a near-constant
+# baseline does not turn clock jitter into anomalies
+ANOMALY_MIN_STD = float(os.getenv("ANOMALY_MIN_STD", "0.001"))
+# Recent events kept in memory
+ANOMALY_EVENT_BUFFER = int(os.getenv("ANOMALY_EVENT_BUFFER", "100"))
+# Events queued per stream subscriber before further events are dropped
+ANOMALY_SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class LatencyDetector:
+    """
+    Incremental change detector for one latency series.
+
+    The baseline mean and variance are kept with Welford's algorithm, an
+    EWMA tracks the current level, and a two-sided CUSUM over the
+    standardized deviation from the baseline flags sustained shifts. After
+    a shift the baseline is restarted, so the detector learns the new level.
+    All updates are O(1).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewma: Optional[float] = None
+        self.ewm_var = 0.0
+        self.cusum_high = 0.0
+        self.cusum_low = 0.0
+        self.samples = 0
+        self.last_spike = -ANOMALY_SPIKE_COOLDOWN
+
+    @property
+    def std(self) -> float:
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(self.m2 / (self.count - 1))
+
+    def _reset_baseline(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.cusum_high = 0.0
+        self.cusum_low = 0.0
+
+    def observe(self, value: float) -> Optional[dict]:
+        """
+        Add a latency sample.
+
+        Returns:
+            dict: An event with kind "shift_up", "shift_down" or "spike",
+            or None
+        """
+        self.samples += 1
+
+        if self.ewma is None:
+            self.ewma = value
+        else:
+            diff = value - self.ewma
+            increment = ANOMALY_EWMA_ALPHA * diff
+            self.ewma += increment
+            self.ewm_var = (1 - ANOMALY_EWMA_ALPHA) * (self.ewm_var + diff * increment)
+
+        event = None
+        if self.count >= ANOMALY_WARMUP:
+            std = max(self.std, ANOMALY_MIN_STD)
+            z = (value - self.mean) / std
+            # Clamped, so a single outlier cannot trip the CUSUM on its own
+            clamped = max(-ANOMALY_SPIKE_Z, min(ANOMALY_SPIKE_Z, z))
+            self.cusum_high = max(0.0, self.cusum_high + clamped - ANOMALY_CUSUM_K)
+            self.cusum_low = max(0.0, self.cusum_low - clamped - ANOMALY_CUSUM_K)
+
+            if self.cusum_high > ANOMALY_CUSUM_H or self.cusum_low > ANOMALY_CUSUM_H:
+                up = self.cusum_high > ANOMALY_CUSUM_H
+                event = self._event(
+                    "shift_up" if up else "shift_down",
+                    value,
+                    self.cusum_high if up else self.cusum_low,
+                )
+                self._reset_baseline()
+            elif abs(z) > ANOMALY_SPIKE_Z:
+                if self.samples - self.last_spike >= ANOMALY_SPIKE_COOLDOWN:
+                    self.last_spike = self.samples
+                    event = self._event("spike", value, z)
+                # Keep outliers out of the baseline
+                return event
+
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        return event
+
+    def _event(self, kind: str, value: float, score: float) -> dict:
+        return {
+            "detected_at": time.time(),
+            "kind": kind,
+            "value": value,
+            "baseline_mean": self.mean,
+            "baseline_std": self.std,
+            "ewma": self.ewma,
+            "score": score,
+        }
+
+    def state(self) -> dict:
+        return {
+            "samples": self.samples,
+            "baseline_count": self.count,
+            "baseline_mean": self.mean if self.count else None,
+            "baseline_std": self.std,
+            "ewma": self.ewma,
+            "ewma_std": math.sqrt(self.ewm_var),
+            "cusum_high": self.cusum_high,
+            "cusum_low": self.cusum_low,
+            "warming_up": self.count < ANOMALY_WARMUP,
+        }
+
+
+class AnomalyDetector:
+    """
+    Per-case latency detectors fed by the message handlers.
+
+    Events are logged, kept in a ring buffer, passed to every callback in
+    `listeners` and pushed to the queues of stream subscribers.
+    """
+
+    def __init__(self):
+        self.detectors: dict = {}
+        self.events: deque = deque(maxlen=ANOMALY_EVENT_BUFFER)
+        self.listeners: List[Callable[[dict], None]] = []
+        self.subscribers: set = set()
+
+    def observe(self, case: str, value: Optional[float]) -> Optional[dict]:
+        """
+        Add a latency sample for a case.
+
+        Args:
+            case: "first_case" or "second_case"
+            value: Latency in seconds; None is ignored
+
+        Returns:
+            dict: The emitted event, if any
+        """
+        if value is None:
+            return None
+
+        detector = self.detectors.get(case)
+        if detector is None:
+            detector = self.detectors[case] = LatencyDetector()
+
+        event = detector.observe(value)
+        if event is None:
+            return None
+
+        event["case"] = case
+        self.events.append(event)
+        logger.info(
+            f"Latency anomaly in {case}: {event['kind']} "
+            f"(value={value:.6f}s, baseline={event['baseline_mean']:.6f}s)"
+        )
+
+        for listener in self.listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.debug(f"Anomaly listener failed: {e}")
+
+        for subscriber in self.subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except asyncio.QueueFull:
+                pass
+
+        return event
+
+    def subscribe(self) -> asyncio.Queue:
+        """Register a queue receiving every future event."""
+        subscriber: asyncio.Queue = asyncio.Queue(maxsize=ANOMALY_SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: asyncio.Queue) -> None:
+        self.subscribers.discard(subscriber)
+
+    def status(self) -> dict:
+        return {
+            "detectors": {
+                case: detector.state() for case, detector in self.detectors.items()
+            },
+            "recent_events": list(self.events),
+        }
+
+
+def persist_anomaly(event: dict) -> None:
+    """
+    Store an anomaly event; registered as an AnomalyDetector listener.
+    The insert is queued on the database writer thread.
+    """
+    async_db.enqueue(insert_anomaly, event)
+
+
+anomaly_detector = AnomalyDetector()
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Optional
+
+from .database import DATABASE_PATH
+
+logger = logging.getLogger("uvicorn.error")
+
+# Reader threads, each with its own connection; WAL lets them read while
+# the writer commits
+DB_READER_THREADS = int(os.getenv("DB_READER_THREADS", "2"))
+# Rows fetched per batch by AsyncDatabase.stream()
+DB_STREAM_BATCH_SIZE = int(os.getenv("DB_STREAM_BATCH_SIZE", "500"))
+# Longest time a connection waits for a lock held by another connection
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5"))
+# PRAGMA synchronous of the writer; NORMAL only syncs at WAL checkpoints,
+# so a power loss (not a crash) can lose the last commits
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL").strip().upper()
+if DB_SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+    DB_SYNCHRONOUS = "NORMAL"
+
+# Queued on the writer thread to make it exit
+_STOP = object()
+
+
+def _log_failed_write(future: Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logger.debug(f"Queued database write failed: {future.exception()}")
+
+
+class AsyncDatabase:
+    """
+    Awaitable access to the SQLite database without blocking the event loop.
+
+    Writes run in order on a single writer thread owning the only writer
+    connection, so inserts never wait on each other's locks. Reads run on
+    a small pool of reader threads with their own connections; in WAL mode
+    they see the last committed data and never block, or are blocked by,
+    the writer.
+
+    Functions passed to write() and read() receive the connection as their
+    first argument, so the helpers in database.py can be used as they are.
+    """
+
+    def __init__(self, db_file: Optional[str] = None, readers: int = DB_READER_THREADS):
+        """
+        Args:
+            db_file: Database path (default: DATABASE_PATH)
+            readers: Number of reader threads
+        """
+        self.db_file = db_file
+        self.readers = max(readers, 1)
+        self._lock = threading.Lock()
+        self._jobs: Optional[queue.SimpleQueue] = None
+        self._writer: Optional[threading.Thread] = None
+        self._reader_pool: Optional[ThreadPoolExecutor] = None
+        self._reader_connections: list = []
+        self._local = threading.local()
+
+    @property
+    def path(self) -> str:
+        return self.db_file or DATABASE_PATH
+
+    @property
+    def pending_writes(self) -> int:
+        """Writes queued but not yet executed."""
+        return self._jobs.qsize() if self._jobs is not None else 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # Reader connections are closed from the thread calling close()
+        return sqlite3.connect(
+            self.path, timeout=DB_BUSY_TIMEOUT, check_same_thread=False
+        )
+
+    def _start(self) -> None:
+        """Start the writer thread and reader pool; the caller holds _lock."""
+        if self._writer is not None:
+            return
+        self._jobs = queue.SimpleQueue()
+        self._writer = threading.Thread(
+            target=self._write_loop, args=(self._jobs,), name="db-writer", daemon=True
+        )
+        self._writer.start()
+        self._reader_pool = ThreadPoolExecutor(
+            max_workers=self.readers, thread_name_prefix="db-reader"
+        )
+
+    def _write_loop(self, jobs: queue.SimpleQueue) -> None:
+        conn = None
+        try:
+            conn = self._connect()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+            logger.debug(f"Database writer connected: {self.path}")
+        except sqlite3.Error as e:
+            logger.debug(f"Error connecting database writer: {e}")
+            conn = None
+
+        while True:
+            job = jobs.get()
+            if job is _STOP:
+                break
+            future, fn, args, kwargs = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if conn is None:
+                    raise RuntimeError("Failed to connect to database")
+                future.set_result(fn(conn, *args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+        if conn is not None:
+            conn.close()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Queue fn(conn, *args, **kwargs) on the writer thread without waiting,
+        e.g. from synchronous listeners running on the event loop.
+
+        Returns:
+            Future: Resolves to the return value of fn
+        """
+        future = Future()
+        with self._lock:
+            self._start()
+            self._jobs.put((future, fn, args, kwargs))
+        return future
+
+    def enqueue(self, fn: Callable, *args, **kwargs) -> None:
+        """
+        Like submit(), for writes nobody waits on: failures are logged.
+        """
+        self.submit(fn, *args, **kwargs).add_done_callback(_log_failed_write)
+
+    async def write(self, fn: Callable, *args, **kwargs):
+        """
+        Run fn(conn, *args, **kwargs) on the writer thread.
+
+        Returns:
+            The return value of fn
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def _read(self, fn: Callable, args: tuple, kwargs: dict):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self._reader_connections.append(conn)
+        return fn(conn, *args, **kwargs)
+
+    async def read(self, fn: Callable, *args, **kwargs):
+        """
+        Run fn(conn, *args, **kwargs) on a reader thread.
+
+        Returns:
+            The return value of fn
+        """
+        with self._lock:
+            self._start()
+            pool = self._reader_pool
+        return await asyncio.get_running_loop().run_in_executor(
+            pool, self._read, fn, args, kwargs
+        )
+
+    async def query(self, sql: str, params: tuple = ()) -> list:
+        """
+        Run a read-only query on a reader thread.
+
+        Returns:
+            list: All result rows
+        """
+        return await self.read(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def stream(
+        self, sql: str, params: tuple = (), batch_size: int = DB_STREAM_BATCH_SIZE
+    ) -> AsyncIterator[list]:
+        """
+        Run a read-only query and yield its rows in batches, without loading
+        the whole result. The query gets its own connection, so it reads one
+        consistent snapshot however long the consumer takes.
+
+        Yields:
+            list: Up to batch_size rows
+        """
+        with self._lock:
+            self._start()
+            pool = self._reader_pool
+        loop = asyncio.get_running_loop()
+
+        conn = await loop.run_in_executor(pool, self._connect)
+        try:
+            cursor = await loop.run_in_executor(pool, conn.execute, sql, params)
+            while True:
+                rows = await loop.run_in_executor(pool, cursor.fetchmany, batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+
+    def close(self) -> None:
+        """
+        Finish the queued writes, then stop the threads and close every
+        connection. The next call starts them again.
+        """
+        with self._lock:
+            if self._writer is None:
+                return
+            self._jobs.put(_STOP)
+            writer, pool = self._writer, self._reader_pool
+            connections = self._reader_connections
+            self._writer = None
+            self._jobs = None
+            self._reader_pool = None
+            self._reader_connections = []
+            self._local = threading.local()
+
+        writer.join()
+        pool.shutdown(wait=True)
+        for conn in connections:
+            conn.close()
+        logger.debug("Database threads stopped")
+
+
+# Global async database instance
+async_db = AsyncDatabase()
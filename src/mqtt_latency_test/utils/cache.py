@@ -0,0 +1,227 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+logger = logging.getLogger("uvicorn.error")
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 512
+
+# Encoding or compressing more than this is done in a worker thread, so a
+# large body does not stall the event loop (and every webhook with it)
+OFFLOAD_SIZE = 64 * 1024
+
+# List items per json.dumps() call when encoding large bodies; the thread
+# gives up the GIL between calls, so the event loop keeps running
+ENCODE_BATCH_SIZE = 1000
+
+# Versions restart from zero with the process, so ETags are salted per process
+_ETAG_SALT = os.urandom(8)
+
+
+def encode_json(content: dict) -> bytes:
+    """Encode content the same way FastAPI's JSONResponse does."""
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def encode_json_batched(content: dict, batch_size: int = ENCODE_BATCH_SIZE) -> bytes:
+    """
+    Encode content like encode_json(), with top-level lists encoded
+    batch_size items at a time. The output is identical; meant to run in
+    a worker thread, which can then share the GIL with the event loop.
+    """
+    parts = []
+    for name, value in content.items():
+        if isinstance(value, list) and len(value) > batch_size:
+            batches = (
+                encode_json(value[start : start + batch_size])[1:-1]
+                for start in range(0, len(value), batch_size)
+            )
+            encoded = b"[" + b",".join(batches) + b"]"
+        else:
+            encoded = encode_json(value)
+        parts.append(encode_json(name) + b":" + encoded)
+    return b"{" + b",".join(parts) + b"}"
+
+
+async def encode_json_async(content: dict) -> bytes:
+    """Encode content, in a worker thread if it holds a large list."""
+    if any(
+        isinstance(value, list) and len(value) > ENCODE_BATCH_SIZE
+        for value in content.values()
+    ):
+        return await asyncio.to_thread(encode_json_batched, content)
+    return encode_json(content)
+
+
+class CachedBody:
+    """
+    An encoded JSON body with its ETag and lazily compressed variants.
+    """
+
+    def __init__(self, version: Hashable, etag: str, body: bytes):
+        self.version = version
+        self.etag = etag
+        self.body = body
+        self._encoded: dict = {}
+
+    def encoded(self, encoding: Optional[str]) -> bytes:
+        """
+        Get the body for a content encoding, compressing it once on first use.
+
+        Args:
+            encoding: "zstd", "gzip" or None for identity
+
+        Returns:
+            bytes: The (compressed) body
+        """
+        if encoding is None:
+            return self.body
+
+        data = self._encoded.get(encoding)
+        if data is None:
+            if encoding == "zstd":
+                data = zstandard.ZstdCompressor(level=3).compress(self.body)
+            else:
+                data = gzip.compress(self.body, compresslevel=6)
+            self._encoded[encoding] = data
+        return data
+
+    async def negotiate(
+        self, accept_encoding: Optional[str]
+    ) -> Tuple[Optional[str], bytes]:
+        """
+        Pick the encoding for a request and return it with the matching body.
+        Small bodies are always sent uncompressed; large ones are compressed
+        in a worker thread the first time an encoding is requested.
+        """
+        if len(self.body) < MIN_COMPRESS_SIZE:
+            return None, self.body
+        encoding = choose_encoding(accept_encoding)
+        if (
+            encoding is not None
+            and encoding not in self._encoded
+            and len(self.body) > OFFLOAD_SIZE
+        ):
+            return encoding, await asyncio.to_thread(self.encoded, encoding)
+        return encoding, self.encoded(encoding)
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """Check an If-None-Match header against this body's ETag."""
+        if not if_none_match or not self.etag:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        tag = self.etag.removeprefix("W/")
+        return any(
+            candidate.strip().removeprefix("W/") == tag
+            for candidate in if_none_match.split(",")
+        )
+
+
+class ResponseCache:
+    """
+    Small LRU cache of encoded JSON bodies.
+
+    Entries are keyed by route and query parameters and carry the version
+    (e.g. the newest and oldest row ids) they were built from. An entry is
+    only served while its version matches the current one.
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, version: Hashable) -> Optional[CachedBody]:
+        entry = self._entries.get(key)
+        if entry is None or entry.version != version:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: Hashable, version: Hashable, body: bytes) -> CachedBody:
+        """Store an encoded body for key at version."""
+        digest = hashlib.blake2b(
+            repr((key, version)).encode(), digest_size=12, salt=_ETAG_SALT
+        )
+        entry = CachedBody(version, f'W/"{digest.hexdigest()}"', body)
+
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    async def get_or_build(
+        self,
+        key: Hashable,
+        get_version: Callable[[], Awaitable[Hashable]],
+        build: Callable[[], Awaitable[dict]],
+        cacheable: Callable[[dict], bool] = lambda content: True,
+    ) -> CachedBody:
+        """
+        Return the cached body for key, rebuilding it if the version moved.
+
+        The version is read before building; if it changed while building
+        (or the content is not cacheable) the body is returned uncached.
+        Large bodies are encoded off the event loop and cached as bytes.
+        """
+        version = await get_version()
+        entry = self.get(key, version)
+        if entry is not None:
+            return entry
+
+        content = await build()
+        body = await encode_json_async(content)
+        if cacheable(content) and await get_version() == version:
+            return self.put(key, version, body)
+        return CachedBody(None, "", body)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick the preferred content encoding supported by both sides.
+
+    Args:
+        accept_encoding: The request's Accept-Encoding header
+
+    Returns:
+        str: "zstd", "gzip" or None for identity
+    """
+    if not accept_encoding:
+        return None
+
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+
+    if zstandard is not None and "zstd" in accepted:
+        return "zstd"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+response_cache = ResponseCache()
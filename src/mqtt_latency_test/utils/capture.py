@@ -0,0 +1,173 @@
+import gzip
+import os
+import queue
+import struct
+import threading
+import time
+import logging
+from typing import Iterator, Optional, Tuple
+
+from .ntp import ntp_sync
+
+logger = logging.getLogger("uvicorn.error")
+
+# Directory for captured webhook traffic (capture is disabled when unset)
+CAPTURE_DIR = os.getenv("CAPTURE_DIR")
+# Rotate segments after this many uncompressed bytes or seconds
+CAPTURE_SEGMENT_BYTES = int(os.getenv("CAPTURE_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+CAPTURE_SEGMENT_SECONDS = int(os.getenv("CAPTURE_SEGMENT_SECONDS", "3600"))
+# Records waiting to be written; further records are dropped when full
+CAPTURE_QUEUE_SIZE = int(os.getenv("CAPTURE_QUEUE_SIZE", "10000"))
+
+# Record header: arrival time (ns), kind, body length
+RECORD_HEADER = struct.Struct("<QBI")
+KINDS = {"publish": 1, "subscribe": 2}
+KIND_NAMES = {value: name for name, value in KINDS.items()}
+SEGMENT_PREFIX = "capture-"
+SEGMENT_SUFFIX = ".bin.gz"
+
+
+class TrafficCapture:
+    """
+    Append-only capture of raw webhook bodies.
+
+    Records are queued by the request handlers and written by a background
+    thread into gzip segments named after their start time. Each segment
+    is flushed after every burst of records, so a crash loses at most the
+    records still in the queue; readers stop at a truncated tail.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = CAPTURE_DIR,
+        segment_bytes: int = CAPTURE_SEGMENT_BYTES,
+        segment_seconds: int = CAPTURE_SEGMENT_SECONDS,
+    ):
+        self.directory = directory
+        self.enabled = bool(directory)
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.recorded = 0
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=CAPTURE_QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self._segment = None
+        self._segment_size = 0
+        self._segment_started = 0.0
+
+    def arrival_ns(self) -> int:
+        """NTP-corrected arrival time in epoch nanoseconds, without blocking."""
+        return time.time_ns() + int((ntp_sync.time_offset or 0.0) * 1e9)
+
+    def record(self, kind: str, body: bytes, arrival_ns: int) -> None:
+        """Queue a raw request body for capture."""
+        if not self.enabled:
+            return
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait((arrival_ns, KINDS[kind], body))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Write out queued records and close the current segment."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(
+            target=self._run, name="traffic-capture", daemon=True
+        )
+        self._thread.start()
+
+    def _open_segment(self) -> None:
+        if self._segment is not None:
+            self._segment.close()
+        name = f"{SEGMENT_PREFIX}{time.time_ns():020d}{SEGMENT_SUFFIX}"
+        self._segment = gzip.open(os.path.join(self.directory, name), "wb")
+        self._segment_size = 0
+        self._segment_started = time.monotonic()
+        logger.debug(f"Capture segment opened: {name}")
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                while item is not None:
+                    self._write(*item)
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            except OSError as e:
+                logger.debug(f"Capture write failed: {e}")
+
+            if self._segment is not None:
+                self._segment.flush()
+            if item is None:
+                if self._segment is not None:
+                    self._segment.close()
+                    self._segment = None
+                return
+
+    def _write(self, arrival_ns: int, kind: int, body: bytes) -> None:
+        if (
+            self._segment is None
+            or self._segment_size >= self.segment_bytes
+            or time.monotonic() - self._segment_started >= self.segment_seconds
+        ):
+            self._open_segment()
+
+        self._segment.write(RECORD_HEADER.pack(arrival_ns, kind, len(body)))
+        self._segment.write(body)
+        self._segment_size += RECORD_HEADER.size + len(body)
+        self.recorded += 1
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "directory": self.directory,
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "queued": self._queue.qsize(),
+        }
+
+
+def list_segments(directory: str) -> list:
+    """List capture segment paths in chronological order."""
+    names = sorted(
+        name
+        for name in os.listdir(directory)
+        if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+    )
+    return [os.path.join(directory, name) for name in names]
+
+
+def read_segment(path: str) -> Iterator[Tuple[int, str, bytes]]:
+    """
+    Read the records of a capture segment.
+
+    Yields:
+        tuple: (arrival_ns, kind, body). Stops quietly at a truncated tail
+        left by a crash.
+    """
+    with gzip.open(path, "rb") as segment:
+        try:
+            while True:
+                header = segment.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+                arrival_ns, kind, length = RECORD_HEADER.unpack(header)
+                body = segment.read(length)
+                if len(body) < length:
+                    return
+                yield arrival_ns, KIND_NAMES.get(kind, "publish"), body
+        except (EOFError, gzip.BadGzipFile) as e:
+            logger.debug(f"Capture segment {path} ends early: {e}")
+
+
+capture = TrafficCapture()
@@ -0,0 +1,201 @@
+import argparse
+import bisect
+import sqlite3
+import logging
+from typing import Sequence
+
+from .database import (
+    DATABASE_PATH,
+    DATABASE_SCHEMA,
+    FIRST_CASE_TABLE,
+    NS_PER_SECOND,
+    create_connection,
+    close_connection,
+    create_ntp_sync_tables,
+    insert_ntp_sync_sample,
+)
+from .async_database import async_db
+
+logger = logging.getLogger("uvicorn.error")
+
+if DATABASE_SCHEMA == "compact":
+    _SERVER_EPOCH_SQL = "server_ns / 1e9"
+else:
+    _SERVER_EPOCH_SQL = "server_timestamp_epoch"
+
+
+def _numpy():
+    """
+    Import NumPy on first use, as this module is imported at startup for
+    persist_ntp_sample(). Returns None if it is not installed, in which
+    case a pure Python loop is used.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def persist_ntp_sample(sample: dict) -> None:
+    """
+    Store an NTP sync sample; registered as an NTPSync sync listener.
+    The insert is queued on the database writer thread. If it fails, the
+    tables are created and it is retried, as the first sync runs
+    concurrently with initialize_database().
+    """
+
+    def persist(conn: sqlite3.Connection) -> bool:
+        row = {
+            "local_time": sample["local_time"],
+            "offset": sample["offset"],
+            "delay": sample.get("delay"),
+            "server": sample.get("server"),
+        }
+        if insert_ntp_sync_sample(conn, **row):
+            return True
+        create_ntp_sync_tables(conn)
+        return insert_ntp_sync_sample(conn, **row)
+
+    async_db.enqueue(persist)
+
+
+def correct_timestamps(
+    stored: Sequence[float],
+    sample_times: Sequence[float],
+    sample_offsets: Sequence[float],
+):
+    """
+    Recompute server timestamps with an offset interpolated between syncs.
+
+    Each stored timestamp was produced as local time plus the offset of the
+    most recent sync. That offset is looked up (in the NTP time domain),
+    removed to recover the local time, and replaced by the offset linearly
+    interpolated between the surrounding samples.
+
+    Args:
+        stored: Stored server timestamps (epoch seconds)
+        sample_times: Local times of the sync samples, ascending
+        sample_offsets: Offsets of the sync samples
+
+    Returns:
+        Corrected server timestamps (epoch seconds), as a NumPy array when
+        NumPy is available and a list otherwise
+    """
+
+    np = _numpy()
+    if np is not None:
+        stored_arr = np.asarray(stored, dtype=np.float64)
+        times = np.asarray(sample_times, dtype=np.float64)
+        offsets = np.asarray(sample_offsets, dtype=np.float64)
+
+        used = np.searchsorted(times + offsets, stored_arr, side="right") - 1
+        used_offset = np.where(used >= 0, offsets[np.clip(used, 0, None)], 0.0)
+        local = stored_arr - used_offset
+        return local + np.interp(local, times, offsets)
+
+    synced_times = [t + o for t, o in zip(sample_times, sample_offsets)]
+    corrected = []
+    for value in stored:
+        used = bisect.bisect_right(synced_times, value) - 1
+        local = value - (sample_offsets[used] if used >= 0 else 0.0)
+
+        i = bisect.bisect_right(sample_times, local)
+        if i == 0:
+            offset = sample_offsets[0]
+        elif i == len(sample_times):
+            offset = sample_offsets[-1]
+        else:
+            t0, t1 = sample_times[i - 1], sample_times[i]
+            o0, o1 = sample_offsets[i - 1], sample_offsets[i]
+            offset = o0 + (o1 - o0) * (local - t0) / (t1 - t0)
+        corrected.append(local + offset)
+    return corrected
+
+
+def recompute_corrections(
+    conn: sqlite3.Connection, batch_size: int = 200_000, from_id: int = 0
+) -> int:
+    """
+    Write interpolated server timestamps for first_case rows into
+    first_case_correction, readable through the first_case_corrected view.
+
+    Args:
+        conn: Database connection
+        batch_size: Rows read and written per transaction
+        from_id: Only correct rows with a greater id
+
+    Returns:
+        int: Number of rows corrected
+    """
+
+    create_ntp_sync_tables(conn)
+
+    cursor = conn.execute(
+        "SELECT local_time, offset_seconds FROM ntp_sync_history ORDER BY local_time"
+    )
+    samples = cursor.fetchall()
+    if not samples:
+        logger.debug("No NTP sync samples recorded, nothing to correct")
+        return 0
+    sample_times = [row[0] for row in samples]
+    sample_offsets = [row[1] for row in samples]
+
+    corrected_rows = 0
+    last_id = from_id
+    while True:
+        cursor = conn.execute(
+            f"""
+            SELECT id, {_SERVER_EPOCH_SQL} FROM {FIRST_CASE_TABLE}
+            WHERE id > ? AND {_SERVER_EPOCH_SQL} IS NOT NULL
+            ORDER BY id
+            LIMIT ?
+            """,
+            (last_id, batch_size),
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+
+        np = _numpy()
+        ids = [row[0] for row in rows]
+        corrected = correct_timestamps(
+            [row[1] for row in rows], sample_times, sample_offsets
+        )
+        if np is not None:
+            server_ns = np.rint(corrected * NS_PER_SECOND).astype(np.int64).tolist()
+        else:
+            server_ns = [round(value * NS_PER_SECOND) for value in corrected]
+
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO first_case_correction (id, server_ns) VALUES (?, ?)",
+                zip(ids, server_ns),
+            )
+
+        corrected_rows += len(rows)
+        last_id = ids[-1]
+        logger.debug(f"Corrected {corrected_rows} rows")
+
+    return corrected_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recompute first_case server timestamps from the NTP sync history."
+    )
+    parser.add_argument("--db", default=DATABASE_PATH, help="Database file")
+    parser.add_argument("--batch-size", type=int, default=200_000)
+    parser.add_argument("--from-id", type=int, default=0)
+    args = parser.parse_args()
+
+    conn = create_connection(args.db)
+    if not conn:
+        raise SystemExit(f"Failed to connect to database: {args.db}")
+    try:
+        count = recompute_corrections(
+            conn, batch_size=args.batch_size, from_id=args.from_id
+        )
+    finally:
+        close_connection(conn)
+    print(f"Corrected rows: {count}")
@@ -1,16 +1,50 @@
 import sqlite3
 import os
 import logging
-from dotenv import load_dotenv
+from datetime import datetime, timezone
 from typing import Optional
 
-logger = logging.getLogger("uvicorn.error")
+from . import env  # noqa: F401  (loads .env before the settings below are read)
 
-load_dotenv()
+logger = logging.getLogger("uvicorn.error")
 
 # Get database file path from environment variable or use default
 DATABASE_PATH = os.getenv("DATABASE_PATH", "database.db")
 
+# Storage schema: "legacy" keeps the original text/real columns, "compact"
+# stores integer nanosecond epochs only and derives the rest at read time
+DATABASE_SCHEMA = os.getenv("DATABASE_SCHEMA", "legacy").strip().lower()
+if DATABASE_SCHEMA not in ("legacy", "compact"):
+    DATABASE_SCHEMA = "legacy"
+
+# Physical table holding first_case rows for the selected schema
+FIRST_CASE_TABLE = "first_case_compact" if DATABASE_SCHEMA == "compact" else "first_case"
+
+# Default test run identifier for the compact schema
+RUN_ID = int(os.getenv("RUN_ID", "0"))
+
+NS_PER_SECOND = 1_000_000_000
+
+def epoch_to_ns(epoch: Optional[float]) -> Optional[int]:
+    """Convert an epoch in seconds to integer nanoseconds."""
+    if epoch is None:
+        return None
+    return int(round(epoch * NS_PER_SECOND))
+
+
+def ns_to_epoch(ns: Optional[int]) -> Optional[float]:
+    """Convert integer nanoseconds to an epoch in seconds."""
+    if ns is None:
+        return None
+    return ns / NS_PER_SECOND
+
+
+def ns_to_iso(ns: Optional[int]) -> Optional[str]:
+    """Convert integer nanoseconds to an ISO 8601 UTC timestamp."""
+    if ns is None:
+        return None
+    return datetime.fromtimestamp(ns / NS_PER_SECOND, tz=timezone.utc).isoformat()
+
 
 def create_connection(db_file: Optional[str] = None):
     """Create a database connection to the SQLite database specified by db_file."""
@@ -40,6 +74,90 @@ def close_connection(conn: sqlite3.Connection):
         logger.debug("No database connection to close.")
 
 
+# EMQX metadata columns added to first_case, per schema
+FIRST_CASE_METADATA_COLUMNS = {
+    "first_case": {
+        "client_id": "INTEGER",
+        "topic_id": "INTEGER",
+        "qos": "INTEGER",
+        "broker_timestamp_epoch": "REAL",
+    },
+    "first_case_compact": {
+        "client_id": "INTEGER",
+        "topic_id": "INTEGER",
+        "qos": "INTEGER",
+        "broker_ns": "INTEGER",
+    },
+}
+
+# Interned client id / topic strings, per dimension table
+_interned: dict = {"mqtt_clients": {}, "mqtt_topics": {}}
+INTERN_CACHE_SIZE = 100_000
+
+
+def create_dimension_tables(conn: sqlite3.Connection):
+    """Create the lookup tables interning MQTT client ids and topics."""
+
+    create_sql = """
+    CREATE TABLE IF NOT EXISTS mqtt_clients (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    );
+
+    CREATE TABLE IF NOT EXISTS mqtt_topics (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    );
+    """
+
+    try:
+        conn.executescript(create_sql)
+        logger.debug("Dimension tables created successfully.")
+    except sqlite3.Error as e:
+        logger.debug(f"Error creating dimension tables: {e}")
+
+
+def add_missing_columns(conn: sqlite3.Connection, table: str, columns: dict):
+    """Add columns missing from an existing table (simple schema migration)."""
+
+    cursor = conn.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cursor.fetchall()}
+    for name, column_type in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+            logger.debug(f"Added column '{name}' to '{table}'")
+    conn.commit()
+
+
+def intern_name(conn: sqlite3.Connection, table: str, name: Optional[str]) -> Optional[int]:
+    """
+    Get the integer id of a client id or topic, adding it if it is new.
+    Ids are cached in process, so known names cost a dictionary lookup.
+
+    Args:
+        conn: Database connection
+        table: "mqtt_clients" or "mqtt_topics"
+        name: The string to intern
+
+    Returns:
+        int: The interned id, or None if name is None
+    """
+
+    if name is None:
+        return None
+
+    cache = _interned[table]
+    ref = cache.get(name)
+    if ref is None:
+        conn.execute(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", (name,))
+        cursor = conn.execute(f"SELECT id FROM {table} WHERE name = ?", (name,))
+        ref = cursor.fetchone()[0]
+        if len(cache) >= INTERN_CACHE_SIZE:
+            cache.clear()
+        cache[name] = ref
+    return ref
+
+
 def create_first_case_table(conn: sqlite3.Connection):
     """Create the first_case table if it doesn't exist."""
 
@@ -56,9 +174,25 @@ def create_first_case_table(conn: sqlite3.Connection):
     );
     """
 
+    create_index_sql = """
+    CREATE INDEX IF NOT EXISTS idx_first_case_server_epoch
+    ON first_case (server_timestamp_epoch);
+    """
+
+    # Covering index for per-client stats
+    create_client_index_sql = """
+    CREATE INDEX IF NOT EXISTS idx_first_case_client
+    ON first_case (client_id, server_timestamp_epoch, difference, broker_timestamp_epoch);
+    """
+
     try:
         cursor = conn.cursor()
         cursor.execute(create_table_sql)
+        cursor.execute(create_index_sql)
+        conn.commit()
+        create_dimension_tables(conn)
+        add_missing_columns(conn, "first_case", FIRST_CASE_METADATA_COLUMNS["first_case"])
+        cursor.execute(create_client_index_sql)
         conn.commit()
         logger.debug("Table 'first_case' created successfully.")
     except sqlite3.Error as e:
@@ -87,6 +221,440 @@ def create_second_case_table(conn: sqlite3.Connection):
         logger.debug(f"Error creating table: {e}")
 
 
+def create_compact_tables(conn: sqlite3.Connection):
+    """
+    Create the compact first_case/second_case tables and their views.
+
+    Rows only keep integer nanosecond epochs. ISO strings, epochs in seconds,
+    the difference and created_at are derived by the views.
+
+    Ids are AUTOINCREMENT, as in the legacy tables: the rollup watermark and
+    the /message/data cache version rely on ids never being reused after
+    pruning empties a table.
+    """
+
+    create_table_sql = """
+    CREATE TABLE IF NOT EXISTS first_case_compact (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id INTEGER NOT NULL DEFAULT 0,
+        iteration INTEGER,
+        payload_ns INTEGER,
+        server_ns INTEGER
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_first_case_compact_server_ns
+    ON first_case_compact (server_ns);
+
+    CREATE TABLE IF NOT EXISTS second_case_compact (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id INTEGER NOT NULL DEFAULT 0,
+        iteration INTEGER,
+        server_ns INTEGER
+    );
+    """
+
+    create_view_sql = """
+    CREATE INDEX IF NOT EXISTS idx_first_case_compact_client
+    ON first_case_compact (client_id, server_ns, payload_ns, broker_ns);
+
+    DROP VIEW IF EXISTS first_case_view;
+    CREATE VIEW first_case_view AS
+    SELECT
+        f.id,
+        f.run_id,
+        f.iteration,
+        strftime('%Y-%m-%dT%H:%M:%fZ', f.payload_ns / 1e9, 'unixepoch')
+            AS payload_timestamp_iso,
+        f.payload_ns / 1e9 AS payload_timestamp_epoch,
+        strftime('%Y-%m-%dT%H:%M:%fZ', f.server_ns / 1e9, 'unixepoch')
+            AS server_timestamp_iso,
+        f.server_ns / 1e9 AS server_timestamp_epoch,
+        (f.server_ns - f.payload_ns) / 1e9 AS difference,
+        datetime(f.server_ns / 1000000000, 'unixepoch') AS created_at,
+        c.name AS clientid,
+        t.name AS topic,
+        f.qos,
+        f.broker_ns / 1e9 AS broker_timestamp_epoch,
+        (f.broker_ns - f.payload_ns) / 1e9 AS device_to_broker,
+        (f.server_ns - f.broker_ns) / 1e9 AS broker_to_webhook
+    FROM first_case_compact f
+    LEFT JOIN mqtt_clients c ON c.id = f.client_id
+    LEFT JOIN mqtt_topics t ON t.id = f.topic_id;
+
+    DROP VIEW IF EXISTS second_case_view;
+    CREATE VIEW second_case_view AS
+    SELECT
+        id,
+        run_id,
+        iteration,
+        strftime('%Y-%m-%dT%H:%M:%fZ', server_ns / 1e9, 'unixepoch')
+            AS server_timestamp_iso,
+        server_ns / 1e9 AS server_timestamp_epoch,
+        datetime(server_ns / 1000000000, 'unixepoch') AS created_at
+    FROM second_case_compact;
+    """
+
+    try:
+        conn.executescript(create_table_sql)
+        create_dimension_tables(conn)
+        add_missing_columns(
+            conn, "first_case_compact", FIRST_CASE_METADATA_COLUMNS["first_case_compact"]
+        )
+        conn.executescript(create_view_sql)
+        logger.debug("Compact tables and views created successfully.")
+    except sqlite3.Error as e:
+        logger.debug(f"Error creating compact tables: {e}")
+
+
+def create_rollup_tables(conn: sqlite3.Connection):
+    """
+    Create the per-minute and per-hour latency rollup tables.
+
+    Each bucket keeps count, min, max, sum and sum of squares of the
+    difference, plus a serialized percentile sketch.
+    """
+
+    create_sql = """
+    CREATE TABLE IF NOT EXISTS first_case_rollup_minute (
+        bucket INTEGER PRIMARY KEY,
+        count INTEGER NOT NULL,
+        min REAL,
+        max REAL,
+        sum REAL NOT NULL,
+        sum_sq REAL NOT NULL,
+        sketch TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS first_case_rollup_hour (
+        bucket INTEGER PRIMARY KEY,
+        count INTEGER NOT NULL,
+        min REAL,
+        max REAL,
+        sum REAL NOT NULL,
+        sum_sq REAL NOT NULL,
+        sketch TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        name TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL
+    );
+    """
+
+    try:
+        conn.executescript(create_sql)
+        logger.debug("Rollup tables created successfully.")
+    except sqlite3.Error as e:
+        logger.debug(f"Error creating rollup tables: {e}")
+
+
+def create_corrected_view(conn: sqlite3.Connection, schema: str = DATABASE_SCHEMA):
+    """
+    (Re)create the first_case_corrected view for a schema. The view is
+    dropped first, so it follows the first_case table of the current schema
+    (e.g. after migrating to the compact schema).
+
+    Args:
+        conn: Database connection
+        schema: "legacy" or "compact" (default: DATABASE_SCHEMA)
+    """
+
+    if schema == "compact":
+        view_sql = """
+        DROP VIEW IF EXISTS first_case_corrected;
+        CREATE VIEW first_case_corrected AS
+        SELECT
+            f.id,
+            f.iteration,
+            f.payload_ns / 1e9 AS payload_timestamp_epoch,
+            f.server_ns / 1e9 AS server_timestamp_epoch,
+            (f.server_ns - f.payload_ns) / 1e9 AS difference,
+            c.server_ns / 1e9 AS corrected_server_timestamp_epoch,
+            (c.server_ns - f.payload_ns) / 1e9 AS corrected_difference
+        FROM first_case_compact f
+        LEFT JOIN first_case_correction c ON c.id = f.id;
+        """
+    else:
+        view_sql = """
+        DROP VIEW IF EXISTS first_case_corrected;
+        CREATE VIEW first_case_corrected AS
+        SELECT
+            f.id,
+            f.iteration,
+            f.payload_timestamp_epoch,
+            f.server_timestamp_epoch,
+            f.difference,
+            c.server_ns / 1e9 AS corrected_server_timestamp_epoch,
+            c.server_ns / 1e9 - f.payload_timestamp_epoch AS corrected_difference
+        FROM first_case f
+        LEFT JOIN first_case_correction c ON c.id = f.id;
+        """
+
+    try:
+        conn.executescript(view_sql)
+    except sqlite3.Error as e:
+        logger.debug(f"Error creating first_case_corrected view: {e}")
+
+
+def create_ntp_sync_tables(conn: sqlite3.Connection):
+    """
+    Create the NTP sync history table and the first_case correction table,
+    plus the first_case_corrected view joining them.
+    """
+
+    create_sql = """
+    CREATE TABLE IF NOT EXISTS ntp_sync_history (
+        id INTEGER PRIMARY KEY,
+        local_time REAL NOT NULL,
+        offset_seconds REAL NOT NULL,
+        delay_seconds REAL,
+        server TEXT
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_ntp_sync_history_local_time
+    ON ntp_sync_history (local_time);
+
+    CREATE TABLE IF NOT EXISTS first_case_correction (
+        id INTEGER PRIMARY KEY,
+        server_ns INTEGER
+    );
+    """
+
+    try:
+        conn.executescript(create_sql)
+        logger.debug("NTP sync history tables created successfully.")
+    except sqlite3.Error as e:
+        logger.debug(f"Error creating NTP sync history tables: {e}")
+
+    create_corrected_view(conn)
+
+
+def insert_ntp_sync_sample(
+    conn: sqlite3.Connection,
+    local_time: float,
+    offset: float,
+    delay: Optional[float],
+    server: Optional[str],
+) -> bool:
+    """
+    Insert an NTP sync sample into the ntp_sync_history table.
+
+    Args:
+        conn: Database connection
+        local_time: Local clock time of the sample (epoch seconds)
+        offset: NTP time minus local time, in seconds
+        delay: Round trip delay of the NTP request, in seconds
+        server: NTP server hostname
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+
+    insert_sql = """
+    INSERT INTO ntp_sync_history (local_time, offset_seconds, delay_seconds, server)
+    VALUES (?, ?, ?, ?);
+    """
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(insert_sql, (local_time, offset, delay, server))
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        logger.debug(f"Error inserting NTP sync sample: {e}")
+        return False
+
+
+def create_anomaly_tables(conn: sqlite3.Connection):
+    """Create the table for latency anomaly events."""
+
+    create_sql = """
+    CREATE TABLE IF NOT EXISTS anomalies (
+        id INTEGER PRIMARY KEY,
+        run_id INTEGER NOT NULL DEFAULT 0,
+        detected_at REAL NOT NULL,
+        case_name TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        value REAL,
+        baseline_mean REAL,
+        baseline_std REAL,
+        ewma REAL,
+        score REAL
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_anomalies_detected_at
+    ON anomalies (detected_at);
+    """
+
+    try:
+        conn.executescript(create_sql)
+        logger.debug("Anomalies table created successfully.")
+    except sqlite3.Error as e:
+        logger.debug(f"Error creating anomalies table: {e}")
+
+
+def insert_anomaly(conn: sqlite3.Connection, event: dict) -> bool:
+    """
+    Insert a latency anomaly event into the anomalies table.
+
+    Args:
+        conn: Database connection
+        event: Event dict produced by the anomaly detector
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+
+    insert_sql = """
+    INSERT INTO anomalies (
+        run_id, detected_at, case_name, kind, value,
+        baseline_mean, baseline_std, ewma, score
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+    """
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            insert_sql,
+            (
+                RUN_ID,
+                event["detected_at"],
+                event["case"],
+                event["kind"],
+                event.get("value"),
+                event.get("baseline_mean"),
+                event.get("baseline_std"),
+                event.get("ewma"),
+                event.get("score"),
+            ),
+        )
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        logger.debug(f"Error inserting anomaly: {e}")
+        return False
+
+
+def fetch_anomalies(conn: sqlite3.Connection, limit: int = 100) -> list:
+    """
+    Fetch the most recent anomaly events, newest first.
+
+    Args:
+        conn: Database connection
+        limit: Maximum number of events
+
+    Returns:
+        list: Anomaly events as dicts
+    """
+
+    cursor = conn.execute(
+        """
+        SELECT id, run_id, detected_at, case_name, kind, value,
+               baseline_mean, baseline_std, ewma, score
+        FROM anomalies
+        ORDER BY detected_at DESC
+        LIMIT ?
+        """,
+        (limit,),
+    )
+    columns = [description[0] for description in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def insert_first_case_compact(
+    conn: sqlite3.Connection,
+    run_id: int,
+    iteration: Optional[int],
+    payload_ns: Optional[int],
+    server_ns: Optional[int],
+    client: Optional[str] = None,
+    topic: Optional[str] = None,
+    qos: Optional[int] = None,
+    broker_ns: Optional[int] = None,
+) -> bool:
+    """
+    Insert data into the first_case_compact table.
+
+    Args:
+        conn: Database connection
+        run_id: Test run identifier
+        iteration: Iteration number from the payload
+        payload_ns: Payload timestamp in epoch nanoseconds
+        server_ns: Server timestamp in epoch nanoseconds
+        client: MQTT client id of the publisher
+        topic: MQTT topic
+        qos: MQTT QoS level
+        broker_ns: Broker receive timestamp in epoch nanoseconds
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+
+    insert_sql = """
+    INSERT INTO first_case_compact (
+        run_id, iteration, payload_ns, server_ns, client_id, topic_id, qos, broker_ns
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+    """
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            insert_sql,
+            (
+                run_id,
+                iteration,
+                payload_ns,
+                server_ns,
+                intern_name(conn, "mqtt_clients", client),
+                intern_name(conn, "mqtt_topics", topic),
+                qos,
+                broker_ns,
+            ),
+        )
+        conn.commit()
+        logger.debug(f"Case 1 data inserted successfully. Row ID: {cursor.lastrowid}")
+        return True
+    except sqlite3.Error as e:
+        logger.debug(f"Error inserting data: {e}")
+        return False
+
+
+def insert_second_case_compact(
+    conn: sqlite3.Connection,
+    run_id: int,
+    iteration: Optional[int],
+    server_ns: Optional[int],
+) -> bool:
+    """
+    Insert data into the second_case_compact table.
+
+    Args:
+        conn: Database connection
+        run_id: Test run identifier
+        iteration: Iteration number from the payload
+        server_ns: Server timestamp in epoch nanoseconds
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+
+    insert_sql = """
+    INSERT INTO second_case_compact (run_id, iteration, server_ns)
+    VALUES (?, ?, ?);
+    """
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(insert_sql, (run_id, iteration, server_ns))
+        conn.commit()
+        logger.debug(f"Case 2 data inserted successfully. Row ID: {cursor.lastrowid}")
+        return True
+    except sqlite3.Error as e:
+        logger.debug(f"Error inserting data: {e}")
+        return False
+
+
 def insert_first_case_data(
     conn: sqlite3.Connection,
     iteration: Optional[int],
@@ -95,9 +663,15 @@ def insert_first_case_data(
     server_timestamp_iso: Optional[str],
     server_timestamp_epoch: Optional[float],
     difference: Optional[float],
+    run_id: Optional[int] = None,
+    client: Optional[str] = None,
+    topic: Optional[str] = None,
+    qos: Optional[int] = None,
+    broker_timestamp_epoch: Optional[float] = None,
 ) -> bool:
     """
     Insert data into the first_case table.
+    With the compact schema only the epochs are kept, as nanoseconds.
 
     Args:
         conn: Database connection
@@ -107,11 +681,29 @@ def insert_first_case_data(
         server_timestamp_iso: ISO timestamp from server
         server_timestamp_epoch: Epoch timestamp from server
         difference: Time difference between server and payload timestamps
+        run_id: Test run identifier (compact schema only, default RUN_ID)
+        client: MQTT client id of the publisher
+        topic: MQTT topic
+        qos: MQTT QoS level
+        broker_timestamp_epoch: Epoch timestamp the broker received the message
 
     Returns:
         bool: True if successful, False otherwise
     """
 
+    if DATABASE_SCHEMA == "compact":
+        return insert_first_case_compact(
+            conn=conn,
+            run_id=RUN_ID if run_id is None else run_id,
+            iteration=iteration,
+            payload_ns=epoch_to_ns(payload_timestamp_epoch),
+            server_ns=epoch_to_ns(server_timestamp_epoch),
+            client=client,
+            topic=topic,
+            qos=qos,
+            broker_ns=epoch_to_ns(broker_timestamp_epoch),
+        )
+
     insert_sql = """
     INSERT INTO first_case (
         iteration, 
@@ -119,8 +711,12 @@ def insert_first_case_data(
         payload_timestamp_epoch, 
         server_timestamp_iso, 
         server_timestamp_epoch, 
-        difference
-    ) VALUES (?, ?, ?, ?, ?, ?);
+        difference,
+        client_id,
+        topic_id,
+        qos,
+        broker_timestamp_epoch
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
     """
 
     try:
@@ -134,6 +730,10 @@ def insert_first_case_data(
                 server_timestamp_iso,
                 server_timestamp_epoch,
                 difference,
+                intern_name(conn, "mqtt_clients", client),
+                intern_name(conn, "mqtt_topics", topic),
+                qos,
+                broker_timestamp_epoch,
             ),
         )
         conn.commit()
@@ -149,20 +749,31 @@ def insert_second_case_data(
     iteration: Optional[int],
     server_timestamp_iso: Optional[str],
     server_timestamp_epoch: Optional[float],
+    run_id: Optional[int] = None,
 ) -> bool:
     """
     Insert data into the second_case table.
+    With the compact schema only the epoch is kept, as nanoseconds.
 
     Args:
         conn: Database connection
         iteration: Iteration number from the payload
         server_timestamp_iso: ISO timestamp from server
         server_timestamp_epoch: Epoch timestamp from server
+        run_id: Test run identifier (compact schema only, default RUN_ID)
 
     Returns:
         bool: True if successful, False otherwise
     """
 
+    if DATABASE_SCHEMA == "compact":
+        return insert_second_case_compact(
+            conn=conn,
+            run_id=RUN_ID if run_id is None else run_id,
+            iteration=iteration,
+            server_ns=epoch_to_ns(server_timestamp_epoch),
+        )
+
     insert_sql = """
     INSERT INTO second_case (
         iteration, 
@@ -197,8 +808,259 @@ def initialize_database(db_file: Optional[str] = None):
 
     conn = create_connection(db_file)
     if conn:
-        create_first_case_table(conn)
-        create_second_case_table(conn)
+        # Readers see committed data without blocking the writer
+        conn.execute("PRAGMA journal_mode=WAL")
+        if DATABASE_SCHEMA == "compact":
+            create_compact_tables(conn)
+        else:
+            create_first_case_table(conn)
+            create_second_case_table(conn)
+        create_rollup_tables(conn)
+        create_ntp_sync_tables(conn)
+        create_anomaly_tables(conn)
         close_connection(conn)
         return True
     return False
+
+
+def checkpoint_database(db_file: Optional[str] = None) -> bool:
+    """
+    Checkpoint the write-ahead log into the database file and truncate it,
+    so the next start does not have to replay it.
+
+    Returns:
+        bool: True if the checkpoint completed, False otherwise
+    """
+
+    conn = create_connection(db_file)
+    if not conn:
+        return False
+    try:
+        busy, log_frames, checkpointed = conn.execute(
+            "PRAGMA wal_checkpoint(TRUNCATE)"
+        ).fetchone()
+        logger.debug(
+            f"Database checkpoint: busy={busy}, log={log_frames}, "
+            f"checkpointed={checkpointed}"
+        )
+        return busy == 0
+    except sqlite3.Error as e:
+        logger.debug(f"Error checkpointing database: {e}")
+        return False
+    finally:
+        close_connection(conn)
+
+
+# Query for all first_case rows, newest first, per schema; rows are turned
+# into the response format by format_first_case_row()
+if DATABASE_SCHEMA == "compact":
+    FIRST_CASE_SELECT_SQL = """
+        SELECT f.id, f.iteration, f.payload_ns, f.server_ns,
+               c.name, t.name, f.qos, f.broker_ns
+        FROM first_case_compact f
+        LEFT JOIN mqtt_clients c ON c.id = f.client_id
+        LEFT JOIN mqtt_topics t ON t.id = f.topic_id
+        ORDER BY f.id DESC
+    """
+else:
+    FIRST_CASE_SELECT_SQL = """
+        SELECT f.id, f.iteration, f.payload_timestamp_iso, f.payload_timestamp_epoch, 
+               f.server_timestamp_iso, f.server_timestamp_epoch, f.difference, f.created_at,
+               c.name, t.name, f.qos, f.broker_timestamp_epoch
+        FROM first_case f
+        LEFT JOIN mqtt_clients c ON c.id = f.client_id
+        LEFT JOIN mqtt_topics t ON t.id = f.topic_id
+        ORDER BY f.created_at DESC
+    """
+
+
+def format_first_case_row(row: tuple) -> dict:
+    """
+    Convert a FIRST_CASE_SELECT_SQL row into the legacy response format.
+    For the compact schema the ISO strings and difference are derived here.
+
+    Args:
+        row: Row returned by FIRST_CASE_SELECT_SQL
+
+    Returns:
+        dict: The row as a dictionary
+    """
+
+    if DATABASE_SCHEMA == "compact":
+        (
+            row_id,
+            iteration,
+            payload_ns,
+            server_ns,
+            client,
+            topic,
+            qos,
+            broker_ns,
+        ) = row
+        difference = None
+        if payload_ns is not None and server_ns is not None:
+            difference = ns_to_epoch(server_ns - payload_ns)
+        return {
+            "id": row_id,
+            "iteration": iteration,
+            "payload_timestamp_iso": ns_to_iso(payload_ns),
+            "payload_timestamp_epoch": ns_to_epoch(payload_ns),
+            "server_timestamp_iso": ns_to_iso(server_ns),
+            "server_timestamp_epoch": ns_to_epoch(server_ns),
+            "difference_seconds": difference,
+            "created_at": (
+                None
+                if server_ns is None
+                else datetime.fromtimestamp(
+                    server_ns // NS_PER_SECOND, tz=timezone.utc
+                ).strftime("%Y-%m-%d %H:%M:%S")
+            ),
+            "clientid": client,
+            "topic": topic,
+            "qos": qos,
+            "broker_timestamp_epoch": ns_to_epoch(broker_ns),
+            **split_latency(
+                ns_to_epoch(payload_ns),
+                ns_to_epoch(broker_ns),
+                ns_to_epoch(server_ns),
+            ),
+        }
+
+    return {
+        "id": row[0],
+        "iteration": row[1],
+        "payload_timestamp_iso": row[2],
+        "payload_timestamp_epoch": row[3],
+        "server_timestamp_iso": row[4],
+        "server_timestamp_epoch": row[5],
+        "difference_seconds": row[6],
+        "created_at": row[7],
+        "clientid": row[8],
+        "topic": row[9],
+        "qos": row[10],
+        "broker_timestamp_epoch": row[11],
+        **split_latency(row[3], row[11], row[5]),
+    }
+
+
+def fetch_first_case_version(conn: sqlite3.Connection) -> tuple:
+    """
+    Get the newest and oldest first_case ids. Inserts move the first and
+    retention pruning the second, whichever process wrote them, so together
+    they identify the rows /message/data returns. Both come from the rowid
+    index, so this stays cheap on large tables.
+
+    Args:
+        conn: Database connection
+
+    Returns:
+        tuple: (max id, min id), (None, None) for an empty table
+    """
+
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT max(id), min(id) FROM {FIRST_CASE_TABLE}")
+    return tuple(cursor.fetchone())
+
+
+def fetch_first_case_data(conn: sqlite3.Connection) -> list:
+    """
+    Fetch all first_case rows, newest first, as dictionaries.
+
+    Args:
+        conn: Database connection
+
+    Returns:
+        list: Rows in the legacy response format
+    """
+
+    cursor = conn.cursor()
+    cursor.execute(FIRST_CASE_SELECT_SQL)
+    return [format_first_case_row(row) for row in cursor.fetchall()]
+
+
+def split_latency(
+    payload_epoch: Optional[float],
+    broker_epoch: Optional[float],
+    server_epoch: Optional[float],
+) -> dict:
+    """
+    Split the end-to-end latency at the broker receive timestamp.
+
+    Returns:
+        dict: device_to_broker_seconds and broker_to_webhook_seconds (None
+        when a timestamp is missing)
+    """
+
+    device_to_broker = None
+    broker_to_webhook = None
+    if broker_epoch is not None:
+        if payload_epoch is not None:
+            device_to_broker = broker_epoch - payload_epoch
+        if server_epoch is not None:
+            broker_to_webhook = server_epoch - broker_epoch
+    return {
+        "device_to_broker_seconds": device_to_broker,
+        "broker_to_webhook_seconds": broker_to_webhook,
+    }
+
+
+def fetch_client_stats(
+    conn: sqlite3.Connection,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+) -> list:
+    """
+    Per-client latency stats, served from the covering client index.
+
+    Args:
+        conn: Database connection
+        start: Range start, epoch seconds (default: beginning of data)
+        end: Range end, epoch seconds (default: no limit)
+
+    Returns:
+        list: One dictionary per client
+    """
+
+    if DATABASE_SCHEMA == "compact":
+        scale = NS_PER_SECOND
+        stats_sql = """
+        SELECT client_id, count(*),
+               avg(server_ns - payload_ns) / 1e9,
+               min(server_ns - payload_ns) / 1e9,
+               max(server_ns - payload_ns) / 1e9,
+               avg(broker_ns - payload_ns) / 1e9,
+               avg(server_ns - broker_ns) / 1e9
+        FROM first_case_compact INDEXED BY idx_first_case_compact_client
+        WHERE client_id IS NOT NULL AND server_ns >= ? AND server_ns < ?
+        GROUP BY client_id
+        """
+    else:
+        scale = 1
+        stats_sql = """
+        SELECT client_id, count(*),
+               avg(difference), min(difference), max(difference),
+               avg(broker_timestamp_epoch - (server_timestamp_epoch - difference)),
+               avg(server_timestamp_epoch - broker_timestamp_epoch)
+        FROM first_case INDEXED BY idx_first_case_client
+        WHERE client_id IS NOT NULL
+          AND server_timestamp_epoch >= ? AND server_timestamp_epoch < ?
+        GROUP BY client_id
+        """
+
+    lower = (start if start is not None else 0.0) * scale
+    upper = (end if end is not None else float("inf")) * scale
+    rows = conn.execute(stats_sql, (lower, upper)).fetchall()
+
+    names = dict(conn.execute("SELECT id, name FROM mqtt_clients").fetchall())
+    return [
+        {
+            "clientid": names.get(row[0]),
+            "count": row[1],
+            "mean": row[2],
+            "min": row[3],
+            "max": row[4],
+            "device_to_broker_mean": row[5],
+            "broker_to_webhook_mean": row[6],
+        }
+        for row in rows
+    ]
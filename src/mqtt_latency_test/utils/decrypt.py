@@ -2,141 +2,267 @@ import json
 import binascii
 import struct
 import os
+import threading
+import time
 import logging
-from dotenv import load_dotenv
-from Crypto.Util.strxor import strxor
+from collections import OrderedDict
+from typing import Optional
+
+from .env import DOTENV_PATH, PROCESS_ENV_KEYS
 
 logger = logging.getLogger("uvicorn.error")
 
-load_dotenv()
+# Optional JSON keyring file: {"default": "<key id>", "keys": {"<key id>": "<hex key>"}}
+MQTT_KEYRING_FILE = os.getenv("MQTT_KEYRING_FILE")
+# Seconds between checks of the keyring file / .env for changes
+KEYRING_RELOAD_INTERVAL = float(os.getenv("KEYRING_RELOAD_INTERVAL", "5"))
+# Number of legacy clients whose trial-decrypted key id is remembered
+KEYRING_FALLBACK_CACHE_SIZE = int(os.getenv("KEYRING_FALLBACK_CACHE_SIZE", "1024"))
+
+# Key id used for the single MQTT_ENCRYPTION_KEY setting
+DEFAULT_KEY_ID = "default"
+
+# Constants for ChaCha20
+CONSTANTS = (0x61707865, 0x3320646E, 0x79622D32, 0x6B206574)
+
+
+def quarter_round(state, a, b, c, d):
+    """ChaCha20 quarter round function"""
+    # a += b; d ^= a; d <<<= 16
+    state[a] = (state[a] + state[b]) & 0xFFFFFFFF
+    state[d] ^= state[a]
+    state[d] = ((state[d] << 16) | (state[d] >> 16)) & 0xFFFFFFFF
 
-MQTT_ENCRYPTION_KEY = os.getenv("MQTT_ENCRYPTION_KEY")
-if not MQTT_ENCRYPTION_KEY:
-    raise ValueError("MQTT_ENCRYPTION_KEY environment variable is not set.")
-HEX_MQTT_ENCRYPTION_KEY = binascii.unhexlify(MQTT_ENCRYPTION_KEY)
+    # c += d; b ^= c; b <<<= 12
+    state[c] = (state[c] + state[d]) & 0xFFFFFFFF
+    state[b] ^= state[c]
+    state[b] = ((state[b] << 12) | (state[b] >> 20)) & 0xFFFFFFFF
 
+    # a += b; d ^= a; d <<<= 8
+    state[a] = (state[a] + state[b]) & 0xFFFFFFFF
+    state[d] ^= state[a]
+    state[d] = ((state[d] << 8) | (state[d] >> 24)) & 0xFFFFFFFF
 
-def decrypt_message(encrypted_hex_message: str, key=HEX_MQTT_ENCRYPTION_KEY) -> dict:
+    # c += d; b ^= c; b <<<= 7
+    state[c] = (state[c] + state[d]) & 0xFFFFFFFF
+    state[b] ^= state[c]
+    state[b] = ((state[b] << 7) | (state[b] >> 25)) & 0xFFFFFFFF
+
+    return state
+
+
+def chacha20_block(key_state, counter_value, nonce_words):
     """
-    Decrypts a hex-encoded ChaCha20 encrypted message.
+    Generate a ChaCha20 block.
+
     Args:
-        encrypted_hex_message (str): The hex-encoded encrypted message.
-        key (bytes): The 256-bit key for decryption. Default is a predefined key.
-    Returns:
-        dict: The decrypted JSON payload.
-    Raises:
-        ValueError: If the hex message format is invalid or decryption fails.
-        UnicodeDecodeError: If the decrypted bytes cannot be decoded as UTF-8.
-        json.JSONDecodeError: If the decrypted message is not valid JSON.
+        key_state: Constants and key words (12 words), precomputed per key
+        counter_value: 64-bit block counter
+        nonce_words: The two 32-bit nonce words
     """
+    # Create initial state: constants, key, counter and nonce
+    state = list(key_state)
+    state.append(counter_value & 0xFFFFFFFF)  # Lower 32 bits of counter
+    state.append((counter_value >> 32) & 0xFFFFFFFF)  # Upper 32 bits of counter
+    state.extend(nonce_words)
 
-    def quarter_round(state, a, b, c, d):
-        """ChaCha20 quarter round function"""
-        # a += b; d ^= a; d <<<= 16
-        state[a] = (state[a] + state[b]) & 0xFFFFFFFF
-        state[d] ^= state[a]
-        state[d] = ((state[d] << 16) | (state[d] >> 16)) & 0xFFFFFFFF
-
-        # c += d; b ^= c; b <<<= 12
-        state[c] = (state[c] + state[d]) & 0xFFFFFFFF
-        state[b] ^= state[c]
-        state[b] = ((state[b] << 12) | (state[b] >> 20)) & 0xFFFFFFFF
-
-        # a += b; d ^= a; d <<<= 8
-        state[a] = (state[a] + state[b]) & 0xFFFFFFFF
-        state[d] ^= state[a]
-        state[d] = ((state[d] << 8) | (state[d] >> 24)) & 0xFFFFFFFF
-
-        # c += d; b ^= c; b <<<= 7
-        state[c] = (state[c] + state[d]) & 0xFFFFFFFF
-        state[b] ^= state[c]
-        state[b] = ((state[b] << 7) | (state[b] >> 25)) & 0xFFFFFFFF
-
-        return state
-
-    def chacha20_block(key, counter_value, nonce):
-        """Generate a ChaCha20 block"""
-        # Constants for ChaCha20
-        CONSTANTS = [0x61707865, 0x3320646E, 0x79622D32, 0x6B206574]
-
-        # Create initial state
-        state = CONSTANTS[:]  # Copy the constants
-
-        # Add key words (8 for 256-bit key)
-        for i in range(8):
-            state.append(struct.unpack("<I", key[i * 4 : i * 4 + 4])[0])
-
-        # Add counter and nonce
-        state.append(counter_value & 0xFFFFFFFF)  # Lower 32 bits of counter
-        state.append((counter_value >> 32) & 0xFFFFFFFF)  # Upper 32 bits of counter
-        state.append(struct.unpack("<I", nonce[:4])[0])
-        state.append(struct.unpack("<I", nonce[4:8])[0])
-
-        # Copy initial state
-        working_state = state[:]
-
-        # ChaCha20 rounds (20 rounds = 10 iterations of double round)
-        for _ in range(10):
-            # Column round
-            working_state = quarter_round(working_state, 0, 4, 8, 12)
-            working_state = quarter_round(working_state, 1, 5, 9, 13)
-            working_state = quarter_round(working_state, 2, 6, 10, 14)
-            working_state = quarter_round(working_state, 3, 7, 11, 15)
-
-            # Diagonal round
-            working_state = quarter_round(working_state, 0, 5, 10, 15)
-            working_state = quarter_round(working_state, 1, 6, 11, 12)
-            working_state = quarter_round(working_state, 2, 7, 8, 13)
-            working_state = quarter_round(working_state, 3, 4, 9, 14)
-
-        # Add working state to initial state
-        for i in range(16):
-            state[i] = (state[i] + working_state[i]) & 0xFFFFFFFF
-
-        # Convert state to bytes
-        result = bytearray(64)
-        for i in range(16):
-            struct.pack_into("<I", result, i * 4, state[i])
-
-        return bytes(result)
+    # Copy initial state
+    working_state = state[:]
 
-    try:
-        encrypted_message = binascii.unhexlify(encrypted_hex_message)
-    except (ValueError, binascii.Error) as e:
-        raise ValueError(f"Invalid hex string format: {e}") from e
+    # ChaCha20 rounds (20 rounds = 10 iterations of double round)
+    for _ in range(10):
+        # Column round
+        working_state = quarter_round(working_state, 0, 4, 8, 12)
+        working_state = quarter_round(working_state, 1, 5, 9, 13)
+        working_state = quarter_round(working_state, 2, 6, 10, 14)
+        working_state = quarter_round(working_state, 3, 7, 11, 15)
 
-    if len(encrypted_message) < 16:
-        raise ValueError(
-            f"Encrypted message too short: {len(encrypted_message)} bytes, minimum 16 required"
-        )
+        # Diagonal round
+        working_state = quarter_round(working_state, 0, 5, 10, 15)
+        working_state = quarter_round(working_state, 1, 6, 11, 12)
+        working_state = quarter_round(working_state, 2, 7, 8, 13)
+        working_state = quarter_round(working_state, 3, 4, 9, 14)
 
-    iv = encrypted_message[:8]
-    counter_bytes = encrypted_message[8:16]
-    ciphertext = encrypted_message[16:]
+    # Add working state to initial state and convert to bytes
+    return struct.pack(
+        "<16I", *((state[i] + working_state[i]) & 0xFFFFFFFF for i in range(16))
+    )
 
-    # print(f"IV: {iv.hex()}")
-    # print(f"Counter: {counter_bytes.hex()}")
-    # print(f"Ciphertext: {ciphertext.hex()}")
-    # print(f"Ciphertext length: {len(ciphertext)} bytes")
 
-    # Get the starting counter value as a 64-bit integer
-    counter_value = int.from_bytes(counter_bytes, byteorder="little")
+class KeyEntry:
+    """A decryption key with its precomputed ChaCha20 state words."""
+
+    __slots__ = ("key_id", "key", "state")
 
-    # Create an empty buffer for the keystream
-    keystream = bytearray()
+    def __init__(self, key_id: str, key: bytes):
+        if len(key) != 32:
+            raise ValueError(f"Key '{key_id}' must be 32 bytes, got {len(key)}")
+        self.key_id = key_id
+        self.key = key
+        self.state = CONSTANTS + struct.unpack("<8I", key)
 
+
+class KeyRing:
+    """
+    Decryption keys indexed by key id.
+
+    Keys come from MQTT_ENCRYPTION_KEY (as key id "default"),
+    MQTT_ENCRYPTION_KEYS ("id:hex,id:hex") and the optional MQTT_KEYRING_FILE.
+    The sources are re-read when they change, so keys can be rotated
+    without a restart.
+    """
+
+    def __init__(self, keyring_file: Optional[str] = MQTT_KEYRING_FILE):
+        self.keyring_file = keyring_file
+        self.entries: dict = {}
+        self.default_key_id: Optional[str] = None
+        self.generation = 0
+        # client id -> key id that last decrypted it by trial
+        self._fallback: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._sources_mtime: tuple = ()
+        self._next_check = 0.0
+        self.reload()
+
+    def _sources_signature(self) -> tuple:
+        signature = []
+        for path in (self.keyring_file, DOTENV_PATH):
+            try:
+                signature.append(os.stat(path).st_mtime_ns if path else None)
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def reload(self) -> int:
+        """
+        Re-read all key sources and swap in the new keyring.
+
+        Returns:
+            int: Number of keys loaded
+        """
+        with self._lock:
+            self._sources_mtime = self._sources_signature()
+
+            settings = {}
+            if DOTENV_PATH:
+                from dotenv import dotenv_values
+
+                # Pick up .env edits made after startup
+                settings.update(
+                    {
+                        k: v
+                        for k, v in dotenv_values(DOTENV_PATH).items()
+                        if v is not None
+                    }
+                )
+            # The real environment wins over .env; variables os.environ only
+            # holds because load_dotenv() copied them from .env do not, so
+            # later .env edits still apply
+            settings.update(
+                {
+                    k: v
+                    for k, v in os.environ.items()
+                    if k in PROCESS_ENV_KEYS or k not in settings
+                }
+            )
+
+            entries = {}
+            default_key_id = None
+
+            single_key = settings.get("MQTT_ENCRYPTION_KEY")
+            if single_key:
+                entries[DEFAULT_KEY_ID] = KeyEntry(
+                    DEFAULT_KEY_ID, binascii.unhexlify(single_key.strip())
+                )
+                default_key_id = DEFAULT_KEY_ID
+
+            for item in settings.get("MQTT_ENCRYPTION_KEYS", "").split(","):
+                if not item.strip():
+                    continue
+                key_id, _, hex_key = item.strip().partition(":")
+                entries[key_id] = KeyEntry(key_id, binascii.unhexlify(hex_key))
+                default_key_id = default_key_id or key_id
+
+            if self.keyring_file and os.path.exists(self.keyring_file):
+                with open(self.keyring_file) as f:
+                    keyring = json.load(f)
+                for key_id, hex_key in keyring.get("keys", {}).items():
+                    entries[key_id] = KeyEntry(key_id, binascii.unhexlify(hex_key))
+                default_key_id = keyring.get("default", default_key_id)
+
+            self.entries = entries
+            self.default_key_id = default_key_id
+            self._fallback.clear()
+            self.generation += 1
+
+        logger.debug(f"Keyring loaded {len(entries)} keys (default: {default_key_id})")
+        return len(entries)
+
+    def maybe_reload(self) -> None:
+        """Reload the keyring if its sources changed, checked at most every few seconds."""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + KEYRING_RELOAD_INTERVAL
+        if self._sources_signature() != self._sources_mtime:
+            try:
+                self.reload()
+            except (OSError, ValueError, binascii.Error) as e:
+                logger.debug(f"Keyring reload failed, keeping current keys: {e}")
+
+    def get(self, key_id: str) -> KeyEntry:
+        entry = self.entries.get(key_id)
+        if entry is None:
+            raise ValueError(f"Unknown encryption key id: {key_id}")
+        return entry
+
+    def trial_order(self, client_id: Optional[str]) -> list:
+        """
+        Keys to try for a message without a key id: the key that last worked
+        for this client, then the default key, then all others.
+        """
+        order = []
+        cached = self._fallback.get(client_id) if client_id else None
+        for key_id in (cached, self.default_key_id):
+            if key_id in self.entries and self.entries[key_id] not in order:
+                order.append(self.entries[key_id])
+        order.extend(entry for entry in self.entries.values() if entry not in order)
+        return order
+
+    def remember(self, client_id: Optional[str], key_id: str) -> None:
+        if not client_id:
+            return
+        self._fallback[client_id] = key_id
+        self._fallback.move_to_end(client_id)
+        while len(self._fallback) > KEYRING_FALLBACK_CACHE_SIZE:
+            self._fallback.popitem(last=False)
+
+    def status(self) -> dict:
+        return {
+            "key_ids": sorted(self.entries),
+            "default_key_id": self.default_key_id,
+            "generation": self.generation,
+            "fallback_clients": len(self._fallback),
+        }
+
+
+keyring = KeyRing()
+
+
+def _decrypt_with(key_state, iv_words, counter_value, ciphertext) -> dict:
     # Generate keystream blocks for each 64-byte chunk of ciphertext
     blocks_needed = (len(ciphertext) + 63) // 64  # Ceiling division
-
-    for block in range(blocks_needed):
-        # Generate keystream block with current counter value
-        keystream_block = chacha20_block(key, counter_value + block, iv)
-        keystream.extend(keystream_block)
+    keystream = b"".join(
+        chacha20_block(key_state, counter_value + block, iv_words)
+        for block in range(blocks_needed)
+    )
 
     # Trim keystream to match ciphertext length
     keystream = keystream[: len(ciphertext)]
 
     # XOR keystream with ciphertext to get plaintext
+    from Crypto.Util.strxor import strxor
+
     decrypted_bytes = strxor(ciphertext, keystream)
 
     try:
@@ -158,3 +284,75 @@ def decrypt_message(encrypted_hex_message: str, key=HEX_MQTT_ENCRYPTION_KEY) ->
         logger.debug(f"JSON decode error: {e}")
         logger.debug(f"Decrypted text: {decrypted_message}")
         raise ValueError(f"Failed to parse decrypted message as JSON: {e}") from e
+
+
+def decrypt_message(
+    encrypted_hex_message: str,
+    key: Optional[bytes] = None,
+    key_id: Optional[str] = None,
+    client_id: Optional[str] = None,
+) -> dict:
+    """
+    Decrypts a hex-encoded ChaCha20 encrypted message.
+
+    The key is chosen from, in order: the explicit `key`, the `key_id`
+    argument (e.g. from webhook metadata), a "<key id>:" prefix on the
+    message, or by trial decryption with the keyring for legacy devices.
+
+    Args:
+        encrypted_hex_message (str): The hex-encoded encrypted message.
+        key (bytes): An explicit 256-bit key for decryption.
+        key_id (str): Key id to look up in the keyring.
+        client_id (str): Client id, used to remember trial-decrypt results.
+    Returns:
+        dict: The decrypted JSON payload.
+    Raises:
+        ValueError: If the hex message format is invalid, no key matches or decryption fails.
+    """
+
+    if key is None and key_id is None and ":" in encrypted_hex_message:
+        key_id, _, encrypted_hex_message = encrypted_hex_message.partition(":")
+
+    try:
+        encrypted_message = binascii.unhexlify(encrypted_hex_message)
+    except (ValueError, binascii.Error) as e:
+        raise ValueError(f"Invalid hex string format: {e}") from e
+
+    if len(encrypted_message) < 16:
+        raise ValueError(
+            f"Encrypted message too short: {len(encrypted_message)} bytes, minimum 16 required"
+        )
+
+    iv_words = struct.unpack("<2I", encrypted_message[:8])
+    counter_bytes = encrypted_message[8:16]
+    ciphertext = encrypted_message[16:]
+
+    # Get the starting counter value as a 64-bit integer
+    counter_value = int.from_bytes(counter_bytes, byteorder="little")
+
+    if key is not None:
+        return _decrypt_with(
+            KeyEntry("explicit", key).state, iv_words, counter_value, ciphertext
+        )
+
+    keyring.maybe_reload()
+
+    if key_id is not None:
+        entry = keyring.get(key_id)
+        return _decrypt_with(entry.state, iv_words, counter_value, ciphertext)
+
+    candidates = keyring.trial_order(client_id)
+    if not candidates:
+        raise ValueError("No encryption keys configured")
+
+    last_error: Optional[ValueError] = None
+    for entry in candidates:
+        try:
+            payload = _decrypt_with(entry.state, iv_words, counter_value, ciphertext)
+        except ValueError as e:
+            last_error = e
+            continue
+        keyring.remember(client_id, entry.key_id)
+        return payload
+
+    raise ValueError(f"No configured key could decrypt the message: {last_error}")
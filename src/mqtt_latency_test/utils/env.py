@@ -0,0 +1,34 @@
+import os
+
+
+def find_dotenv_path() -> str:
+    """
+    Find the nearest .env file, searching upwards from this package like
+    python-dotenv's find_dotenv(), without importing python-dotenv.
+
+    Returns:
+        str: Path of the .env file, or "" if there is none
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        candidate = os.path.join(directory, ".env")
+        if os.path.isfile(candidate):
+            return candidate
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return ""
+        directory = parent
+
+
+# .env file loaded into the environment and re-read on keyring reload
+DOTENV_PATH = find_dotenv_path()
+
+# Variables set by the real environment (e.g. docker run -e), which take
+# precedence over .env, as with load_dotenv()
+PROCESS_ENV_KEYS = frozenset(os.environ)
+
+if DOTENV_PATH:
+    # python-dotenv is only imported when there is a file to parse
+    from dotenv import load_dotenv
+
+    load_dotenv(DOTENV_PATH)
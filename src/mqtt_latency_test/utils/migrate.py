@@ -0,0 +1,252 @@
+import argparse
+import logging
+import sqlite3
+from typing import Optional
+
+from .database import (
+    DATABASE_PATH,
+    RUN_ID,
+    create_connection,
+    close_connection,
+    create_compact_tables,
+    create_corrected_view,
+    add_missing_columns,
+    FIRST_CASE_METADATA_COLUMNS,
+)
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def _table_exists(conn: sqlite3.Connection, name: str) -> bool:
+    cursor = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    )
+    return cursor.fetchone() is not None
+
+
+def _get_sequence(conn: sqlite3.Connection, table: str) -> int:
+    """Get the last AUTOINCREMENT id handed out for a table (0 if none)."""
+    if not _table_exists(conn, "sqlite_sequence"):
+        return 0
+    cursor = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def _reserve_ids(conn: sqlite3.Connection, table: str, last_id: int) -> None:
+    """Make new AUTOINCREMENT ids of a table start after last_id."""
+    if last_id <= _get_sequence(conn, table):
+        return
+    cursor = conn.execute(
+        "UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (last_id, table)
+    )
+    if cursor.rowcount == 0:
+        conn.execute(
+            "INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, last_id)
+        )
+
+
+def _rollup_watermark(conn: sqlite3.Connection) -> int:
+    """Get the id up to which first_case rows have been rolled up."""
+    if not _table_exists(conn, "rollup_state"):
+        return 0
+    cursor = conn.execute("SELECT last_id FROM rollup_state WHERE name = 'first_case'")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def _add_autoincrement(conn: sqlite3.Connection, table: str, last_id: int = 0) -> bool:
+    """
+    Rebuild a compact table created before its id was AUTOINCREMENT.
+
+    Without AUTOINCREMENT, SQLite reuses ids once pruning empties the table,
+    so new rows could fall behind the rollup watermark. The table is copied
+    into one declared with AUTOINCREMENT, keeping its ids; new ids start
+    after both the largest copied id and last_id. Indexes and views are
+    dropped with the old table and must be recreated by the caller.
+
+    Returns:
+        bool: True if the table was rebuilt
+    """
+
+    cursor = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    )
+    row = cursor.fetchone()
+    if row is None or "AUTOINCREMENT" in row[0].upper():
+        return False
+
+    rebuilt = f"{table}_rebuild"
+    create_sql = row[0].replace(
+        f"CREATE TABLE {table}", f"CREATE TABLE {rebuilt}", 1
+    ).replace("id INTEGER PRIMARY KEY", "id INTEGER PRIMARY KEY AUTOINCREMENT", 1)
+
+    # Keep views untouched by the rename; they are recreated afterwards
+    conn.execute("PRAGMA legacy_alter_table = ON")
+    try:
+        with conn:
+            conn.execute(create_sql)
+            conn.execute(f"INSERT INTO {rebuilt} SELECT * FROM {table}")
+            conn.execute(f"DROP TABLE {table}")
+            conn.execute(f"ALTER TABLE {rebuilt} RENAME TO {table}")
+            _reserve_ids(conn, table, last_id)
+    finally:
+        conn.execute("PRAGMA legacy_alter_table = OFF")
+
+    logger.debug(f"Rebuilt '{table}' with AUTOINCREMENT ids")
+    return True
+
+
+def _migrate_table(
+    conn: sqlite3.Connection,
+    legacy_table: str,
+    compact_table: str,
+    copy_sql: str,
+    run_id: int,
+    batch_size: int,
+) -> int:
+    """
+    Move rows from a legacy table into its compact table, one batch per
+    transaction. Copied rows are deleted from the legacy table in the same
+    transaction, so an interrupted migration can simply be re-run. The
+    compact table continues the legacy id sequence, so ids of pruned rows
+    are not handed out again.
+
+    Returns:
+        int: Number of rows migrated
+    """
+
+    migrated = 0
+    while True:
+        with conn:
+            cursor = conn.execute(
+                f"SELECT id FROM {legacy_table} ORDER BY id LIMIT 1 OFFSET ?",
+                (batch_size - 1,),
+            )
+            row = cursor.fetchone()
+            if row is None:
+                # Last (partial) batch
+                cursor = conn.execute(f"SELECT max(id) FROM {legacy_table}")
+                row = cursor.fetchone()
+                if row is None or row[0] is None:
+                    break
+            last_id = row[0]
+
+            conn.execute(copy_sql, (run_id, last_id))
+            cursor = conn.execute(
+                f"DELETE FROM {legacy_table} WHERE id <= ?", (last_id,)
+            )
+            migrated += cursor.rowcount
+
+        logger.debug(f"Migrated {migrated} rows from '{legacy_table}'")
+
+    with conn:
+        _reserve_ids(conn, compact_table, _get_sequence(conn, legacy_table))
+        conn.execute(f"DROP TABLE {legacy_table}")
+
+    return migrated
+
+
+def migrate_to_compact(
+    db_file: Optional[str] = None,
+    batch_size: int = 5000,
+    run_id: int = RUN_ID,
+    vacuum: bool = False,
+) -> dict:
+    """
+    Convert a legacy database to the compact schema in place. Compact
+    tables created without AUTOINCREMENT ids are rebuilt with them.
+
+    Args:
+        db_file: Database file (default: DATABASE_PATH)
+        batch_size: Rows moved per transaction
+        run_id: Run identifier assigned to the migrated rows
+        vacuum: Run VACUUM afterwards to return freed pages to the OS
+
+    Returns:
+        dict: Number of migrated rows per table
+    """
+
+    if db_file is None:
+        db_file = DATABASE_PATH
+
+    conn = create_connection(db_file)
+    if not conn:
+        raise RuntimeError(f"Failed to connect to database: {db_file}")
+
+    result = {"first_case": 0, "second_case": 0}
+    try:
+        _add_autoincrement(conn, "first_case_compact", _rollup_watermark(conn))
+        _add_autoincrement(conn, "second_case_compact")
+        create_compact_tables(conn)
+
+        if _table_exists(conn, "first_case"):
+            # Databases older than the metadata columns
+            add_missing_columns(
+                conn, "first_case", FIRST_CASE_METADATA_COLUMNS["first_case"]
+            )
+            result["first_case"] = _migrate_table(
+                conn,
+                "first_case",
+                "first_case_compact",
+                """
+                INSERT INTO first_case_compact (
+                    id, run_id, iteration, payload_ns, server_ns,
+                    client_id, topic_id, qos, broker_ns
+                )
+                SELECT id, ?, iteration,
+                       CAST(round(payload_timestamp_epoch * 1e9) AS INTEGER),
+                       CAST(round(server_timestamp_epoch * 1e9) AS INTEGER),
+                       client_id, topic_id, qos,
+                       CAST(round(broker_timestamp_epoch * 1e9) AS INTEGER)
+                FROM first_case
+                WHERE id <= ?
+                """,
+                run_id,
+                batch_size,
+            )
+
+        if _table_exists(conn, "second_case"):
+            result["second_case"] = _migrate_table(
+                conn,
+                "second_case",
+                "second_case_compact",
+                """
+                INSERT INTO second_case_compact (id, run_id, iteration, server_ns)
+                SELECT id, ?, iteration,
+                       CAST(round(server_timestamp_epoch * 1e9) AS INTEGER)
+                FROM second_case
+                WHERE id <= ?
+                """,
+                run_id,
+                batch_size,
+            )
+
+        # The view still selects from the dropped legacy first_case
+        create_corrected_view(conn, schema="compact")
+
+        if vacuum:
+            conn.execute("VACUUM")
+    finally:
+        close_connection(conn)
+
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert a legacy latency database to the compact schema."
+    )
+    parser.add_argument("--db", default=DATABASE_PATH, help="Database file")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--run-id", type=int, default=RUN_ID)
+    parser.add_argument("--vacuum", action="store_true")
+    args = parser.parse_args()
+
+    migrated = migrate_to_compact(
+        db_file=args.db,
+        batch_size=args.batch_size,
+        run_id=args.run_id,
+        vacuum=args.vacuum,
+    )
+    print(f"Migrated rows: {migrated}")
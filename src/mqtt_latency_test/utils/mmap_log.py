@@ -0,0 +1,632 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Hashable, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # Reads fall back to struct unpacking
+    np = None
+
+from .database import (
+    RUN_ID,
+    NS_PER_SECOND,
+    epoch_to_ns,
+    ns_to_epoch,
+    ns_to_iso,
+    split_latency,
+)
+from .storage import StorageBackend
+
+logger = logging.getLogger("uvicorn.error")
+
+# Directory holding the log segments
+MMAP_LOG_DIR = os.getenv("MMAP_LOG_DIR", "mmap_log")
+# Records per segment file; a full segment is closed and a new one started
+MMAP_SEGMENT_RECORDS = int(os.getenv("MMAP_SEGMENT_RECORDS", str(1 << 20)))
+# Records per sparse time index block
+MMAP_INDEX_STRIDE = int(os.getenv("MMAP_INDEX_STRIDE", "1024"))
+
+# Stored for missing 64-bit values; missing ids and qos are stored as -1
+NULL_NS = -(1 << 63)
+
+# Segment header: magic, format version, record size, record count
+SEGMENT_HEADER = struct.Struct("<4sIIQ")
+SEGMENT_HEADER_SIZE = 64
+SEGMENT_MAGIC = b"MQLT"
+SEGMENT_VERSION = 1
+_COUNT = struct.Struct("<Q")
+_COUNT_OFFSET = 12
+
+
+class RecordLayout:
+    """Fixed-width little-endian record, as a struct and a NumPy dtype."""
+
+    _NUMPY_TYPES = {"q": "<i8", "i": "<i4", "b": "i1"}
+
+    def __init__(self, fields: Tuple[Tuple[str, str], ...]):
+        self.names = tuple(name for name, _ in fields)
+        codes = "".join(code for _, code in fields)
+        # Pad records to 8 bytes so 64-bit fields stay aligned
+        padding = -struct.calcsize("<" + codes) % 8
+        self.struct = struct.Struct("<" + codes + "x" * padding)
+        self.size = self.struct.size
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+        self.dtype = None
+        if np is not None:
+            offsets = [
+                struct.calcsize("<" + codes[:i]) for i in range(len(fields))
+            ]
+            self.dtype = np.dtype(
+                {
+                    "names": list(self.names),
+                    "formats": [self._NUMPY_TYPES[code] for _, code in fields],
+                    "offsets": offsets,
+                    "itemsize": self.size,
+                }
+            )
+
+
+FIRST_CASE_LAYOUT = RecordLayout(
+    (
+        ("server_ns", "q"),
+        ("payload_ns", "q"),
+        ("broker_ns", "q"),
+        ("iteration", "q"),
+        ("run_id", "i"),
+        ("client_id", "i"),
+        ("topic_id", "i"),
+        ("qos", "b"),
+    )
+)
+SECOND_CASE_LAYOUT = RecordLayout(
+    (
+        ("server_ns", "q"),
+        ("iteration", "q"),
+        ("run_id", "i"),
+    )
+)
+
+
+def _ns_or_null(epoch: Optional[float]) -> int:
+    ns = epoch_to_ns(epoch)
+    return NULL_NS if ns is None else ns
+
+
+def _int_or_null(value, null: int) -> int:
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return null
+
+
+class Segment:
+    """
+    One preallocated, memory-mapped segment file.
+
+    The record count in the header is written after each record, so a
+    crash can lose the last record but never expose a torn one. A sparse
+    index keeps the min/max server time of every `index_stride` records,
+    which lets range scans skip blocks without assuming time order.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        layout: RecordLayout,
+        base_id: int,
+        capacity: Optional[int] = None,
+        index_stride: int = MMAP_INDEX_STRIDE,
+    ):
+        self.path = path
+        self.layout = layout
+        self.base_id = base_id
+        self.index_stride = index_stride
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT)
+        try:
+            if capacity is not None:
+                os.ftruncate(fd, SEGMENT_HEADER_SIZE + capacity * layout.size)
+            size = os.fstat(fd).st_size
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        if capacity is not None:
+            SEGMENT_HEADER.pack_into(
+                self.mm, 0, SEGMENT_MAGIC, SEGMENT_VERSION, layout.size, 0
+            )
+        magic, version, record_size, count = SEGMENT_HEADER.unpack_from(self.mm, 0)
+        if magic != SEGMENT_MAGIC or record_size != layout.size:
+            raise ValueError(f"Not a compatible log segment: {path}")
+
+        self.capacity = (size - SEGMENT_HEADER_SIZE) // layout.size
+        self.count = count
+        # Per index block: [min server_ns, max server_ns], None if all missing
+        self.index: List[Optional[list]] = self._build_index(count)
+
+    def _build_index(self, count: int) -> List[Optional[list]]:
+        """Rebuild the sparse index of an existing segment."""
+        if np is None:
+            self.index = []
+            for position in range(count):
+                self._index_record(position, self._server_ns(position))
+            return self.index
+
+        stride = self.index_stride
+        blocks = -(-count // stride)
+        if blocks == 0:
+            return []
+        server_ns = self.view(0, count)["server_ns"]
+        valid = server_ns != NULL_NS
+        # Pad the last block with values that never win min/max
+        padding = blocks * stride - count
+        int64 = np.iinfo(np.int64)
+        lows = np.pad(
+            np.where(valid, server_ns, int64.max), (0, padding), constant_values=int64.max
+        ).reshape(blocks, stride).min(axis=1)
+        highs = np.pad(
+            np.where(valid, server_ns, int64.min), (0, padding), constant_values=int64.min
+        ).reshape(blocks, stride).max(axis=1)
+        del server_ns, valid  # Release the view, so the mapping can be closed
+        return [
+            None if low == int64.max else [int(low), int(high)]
+            for low, high in zip(lows.tolist(), highs.tolist())
+        ]
+
+    def _server_ns(self, position: int) -> int:
+        offset = SEGMENT_HEADER_SIZE + position * self.layout.size
+        return struct.unpack_from("<q", self.mm, offset)[0]
+
+    def _index_record(self, position: int, server_ns: int) -> None:
+        if position % self.index_stride == 0:
+            self.index.append(None)
+        if server_ns == NULL_NS:
+            return
+        block = self.index[-1]
+        if block is None:
+            self.index[-1] = [server_ns, server_ns]
+        elif server_ns < block[0]:
+            block[0] = server_ns
+        elif server_ns > block[1]:
+            block[1] = server_ns
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.capacity
+
+    def append(self, values: tuple) -> int:
+        """Write a record; returns its id."""
+        position = self.count
+        self.layout.struct.pack_into(
+            self.mm, SEGMENT_HEADER_SIZE + position * self.layout.size, *values
+        )
+        self.count = position + 1
+        _COUNT.pack_into(self.mm, _COUNT_OFFSET, self.count)
+        self._index_record(position, values[0])
+        return self.base_id + position + 1
+
+    def view(self, start: int = 0, stop: Optional[int] = None):
+        """
+        Records [start, stop) as a zero-copy NumPy structured array over the
+        mapping when NumPy is available, else as a list of tuples.
+        """
+        stop = self.count if stop is None else min(stop, self.count)
+        offset = SEGMENT_HEADER_SIZE + start * self.layout.size
+        if np is not None:
+            return np.frombuffer(
+                self.mm, dtype=self.layout.dtype, count=stop - start, offset=offset
+            )
+        end = SEGMENT_HEADER_SIZE + stop * self.layout.size
+        return list(self.layout.struct.iter_unpack(self.mm[offset:end]))
+
+    def ranges(self, start_ns: int, end_ns: int) -> Iterator[Tuple[int, int]]:
+        """Record ranges whose index block overlaps [start_ns, end_ns)."""
+        count = self.count
+        run_start = None
+        for block, bounds in enumerate(self.index):
+            overlaps = (
+                bounds is not None and bounds[0] < end_ns and bounds[1] >= start_ns
+            )
+            if overlaps and run_start is None:
+                run_start = block * self.index_stride
+            elif not overlaps and run_start is not None:
+                yield run_start, block * self.index_stride
+                run_start = None
+        if run_start is not None:
+            yield run_start, count
+
+    def flush(self) -> None:
+        self.mm.flush()
+
+    def close(self) -> None:
+        try:
+            self.mm.close()
+        except BufferError:
+            # NumPy views handed out to readers still reference the mapping
+            logger.debug(f"Log segment {self.path} still in use, left mapped")
+
+
+class SegmentLog:
+    """An append-only sequence of segments for one record layout."""
+
+    def __init__(
+        self,
+        directory: str,
+        layout: RecordLayout,
+        segment_records: int = MMAP_SEGMENT_RECORDS,
+        index_stride: int = MMAP_INDEX_STRIDE,
+    ):
+        self.directory = directory
+        self.layout = layout
+        self.segment_records = segment_records
+        self.index_stride = index_stride
+        os.makedirs(directory, exist_ok=True)
+
+        self.segments: List[Segment] = []
+        for name in sorted(os.listdir(directory)):
+            if name.startswith("segment-") and name.endswith(".log"):
+                base_id = int(name[len("segment-") : -len(".log")])
+                self.segments.append(
+                    Segment(
+                        os.path.join(directory, name),
+                        layout,
+                        base_id,
+                        index_stride=index_stride,
+                    )
+                )
+
+    def _rotate(self) -> Segment:
+        if self.segments:
+            last = self.segments[-1]
+            last.flush()
+            base_id = last.base_id + last.count
+        else:
+            base_id = 0
+        segment = Segment(
+            os.path.join(self.directory, f"segment-{base_id:020d}.log"),
+            self.layout,
+            base_id,
+            capacity=self.segment_records,
+            index_stride=self.index_stride,
+        )
+        self.segments.append(segment)
+        logger.debug(f"Log segment opened: {segment.path}")
+        return segment
+
+    @property
+    def record_count(self) -> int:
+        """Records appended over all segments."""
+        if not self.segments:
+            return 0
+        last = self.segments[-1]
+        return last.base_id + last.count
+
+    def append(self, values: tuple) -> int:
+        if not self.segments or self.segments[-1].full:
+            self._rotate()
+        return self.segments[-1].append(values)
+
+    def flush(self) -> None:
+        if self.segments:
+            self.segments[-1].flush()
+
+    def close(self) -> None:
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+
+
+class NameTable:
+    """Interned client ids or topics, appended one JSON string per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.names: List[str] = []
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                self.names = [json.loads(line) for line in file if line.strip()]
+        self.ids = {name: i for i, name in enumerate(self.names)}
+
+    def intern(self, name: Optional[str]) -> int:
+        if name is None:
+            return -1
+        ref = self.ids.get(name)
+        if ref is None:
+            ref = self.ids[name] = len(self.names)
+            self.names.append(name)
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(name) + "\n")
+        return ref
+
+    def name(self, ref: int) -> Optional[str]:
+        return self.names[ref] if 0 <= ref < len(self.names) else None
+
+
+def _mean(values: list) -> Optional[float]:
+    return sum(values) / len(values) if values else None
+
+
+def _percentile_stats(values) -> dict:
+    """Exact stats of sorted latencies, in the get_latency_stats format."""
+    count = len(values)
+    if count == 0:
+        return {"count": 0}
+    if np is not None:
+        mean = float(values.mean())
+        stddev = float(values.std())
+    else:
+        mean = sum(values) / count
+        stddev = max(sum(v * v for v in values) / count - mean * mean, 0.0) ** 0.5
+    stats = {
+        "count": count,
+        "min": float(values[0]),
+        "max": float(values[-1]),
+        "mean": mean,
+        "stddev": stddev,
+    }
+    for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+        stats[name] = float(values[min(int(q * count), count - 1)])
+    return stats
+
+
+class MmapLogBackend(StorageBackend):
+    """
+    Append-only storage of fixed-width binary latency records in
+    memory-mapped, segment-rotated files under MMAP_LOG_DIR.
+
+    Appends are a struct pack into the mapping, with no syscalls. Reads
+    are served from zero-copy NumPy views over the segments, with range
+    scans limited to the blocks selected by the sparse time index.
+    """
+
+    name = "mmap"
+
+    def __init__(
+        self,
+        directory: str = MMAP_LOG_DIR,
+        segment_records: int = MMAP_SEGMENT_RECORDS,
+        index_stride: int = MMAP_INDEX_STRIDE,
+    ):
+        self.directory = directory
+        self.first_case = SegmentLog(
+            os.path.join(directory, "first_case"),
+            FIRST_CASE_LAYOUT,
+            segment_records,
+            index_stride,
+        )
+        self.second_case = SegmentLog(
+            os.path.join(directory, "second_case"),
+            SECOND_CASE_LAYOUT,
+            segment_records,
+            index_stride,
+        )
+        self.clients = NameTable(os.path.join(directory, "clients.jsonl"))
+        self.topics = NameTable(os.path.join(directory, "topics.jsonl"))
+        self._lock = threading.Lock()
+
+    def insert_first_case(
+        self,
+        iteration: Optional[int],
+        payload_timestamp_iso: Optional[str],
+        payload_timestamp_epoch: Optional[float],
+        server_timestamp_iso: Optional[str],
+        server_timestamp_epoch: Optional[float],
+        difference: Optional[float],
+        client: Optional[str] = None,
+        topic: Optional[str] = None,
+        qos: Optional[int] = None,
+        broker_timestamp_epoch: Optional[float] = None,
+    ) -> bool:
+        try:
+            with self._lock:
+                self.first_case.append(
+                    (
+                        _ns_or_null(server_timestamp_epoch),
+                        _ns_or_null(payload_timestamp_epoch),
+                        _ns_or_null(broker_timestamp_epoch),
+                        _int_or_null(iteration, NULL_NS),
+                        RUN_ID,
+                        self.clients.intern(client),
+                        self.topics.intern(topic),
+                        _int_or_null(qos, -1),
+                    )
+                )
+            return True
+        except (OSError, ValueError, struct.error) as e:
+            logger.debug(f"Error appending to log: {e}")
+            return False
+
+    def insert_second_case(
+        self,
+        iteration: Optional[int],
+        server_timestamp_iso: Optional[str],
+        server_timestamp_epoch: Optional[float],
+    ) -> bool:
+        try:
+            with self._lock:
+                self.second_case.append(
+                    (
+                        _ns_or_null(server_timestamp_epoch),
+                        _int_or_null(iteration, NULL_NS),
+                        RUN_ID,
+                    )
+                )
+            return True
+        except (OSError, ValueError, struct.error) as e:
+            logger.debug(f"Error appending to log: {e}")
+            return False
+
+    def _first_case_rows(self, segment: Segment, start: int = 0, stop=None):
+        """Rows of a segment as tuples in FIRST_CASE_LAYOUT field order."""
+        records = segment.view(start, stop)
+        if np is None:
+            return records
+        return zip(*(records[name].tolist() for name in FIRST_CASE_LAYOUT.names))
+
+    def fetch_first_case(self) -> list:
+        data = []
+        for segment in reversed(self.first_case.segments):
+            rows = list(self._first_case_rows(segment))
+            for position in range(len(rows) - 1, -1, -1):
+                (
+                    server_ns,
+                    payload_ns,
+                    broker_ns,
+                    iteration,
+                    _run_id,
+                    client_id,
+                    topic_id,
+                    qos,
+                ) = rows[position]
+                server_ns = None if server_ns == NULL_NS else server_ns
+                payload_ns = None if payload_ns == NULL_NS else payload_ns
+                broker_ns = None if broker_ns == NULL_NS else broker_ns
+                difference = None
+                if payload_ns is not None and server_ns is not None:
+                    difference = ns_to_epoch(server_ns - payload_ns)
+                data.append(
+                    {
+                        "id": segment.base_id + position + 1,
+                        "iteration": None if iteration == NULL_NS else iteration,
+                        "payload_timestamp_iso": ns_to_iso(payload_ns),
+                        "payload_timestamp_epoch": ns_to_epoch(payload_ns),
+                        "server_timestamp_iso": ns_to_iso(server_ns),
+                        "server_timestamp_epoch": ns_to_epoch(server_ns),
+                        "difference_seconds": difference,
+                        "created_at": (
+                            None
+                            if server_ns is None
+                            else datetime.fromtimestamp(
+                                server_ns // NS_PER_SECOND, tz=timezone.utc
+                            ).strftime("%Y-%m-%d %H:%M:%S")
+                        ),
+                        "clientid": self.clients.name(client_id),
+                        "topic": self.topics.name(topic_id),
+                        "qos": None if qos < 0 else qos,
+                        "broker_timestamp_epoch": ns_to_epoch(broker_ns),
+                        **split_latency(
+                            ns_to_epoch(payload_ns),
+                            ns_to_epoch(broker_ns),
+                            ns_to_epoch(server_ns),
+                        ),
+                    }
+                )
+        return data
+
+    async def data_version_async(self) -> Hashable:
+        # The log is append-only, so the record count only moves on insert
+        return self.first_case.record_count
+
+    def _scan(self, start: Optional[float], end: Optional[float]):
+        """
+        First_case records with a server time in [start, end) and a payload
+        time, as a list of NumPy arrays (or of tuples without NumPy).
+        """
+        start_ns = epoch_to_ns(start if start is not None else 0.0)
+        end_ns = epoch_to_ns(end if end is not None else time.time())
+        server = FIRST_CASE_LAYOUT.index["server_ns"]
+        payload = FIRST_CASE_LAYOUT.index["payload_ns"]
+
+        chunks = []
+        for segment in self.first_case.segments:
+            for lo, hi in segment.ranges(start_ns, end_ns):
+                records = segment.view(lo, hi)
+                if np is not None:
+                    mask = (
+                        (records["server_ns"] >= start_ns)
+                        & (records["server_ns"] < end_ns)
+                        & (records["payload_ns"] != NULL_NS)
+                    )
+                    chunks.append(records[mask])
+                else:
+                    chunks.append(
+                        [
+                            row
+                            for row in records
+                            if start_ns <= row[server] < end_ns
+                            and row[payload] != NULL_NS
+                        ]
+                    )
+        return chunks
+
+    def latency_stats(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> dict:
+        chunks = self._scan(start, end)
+        if np is not None:
+            differences = [
+                (chunk["server_ns"] - chunk["payload_ns"]) / NS_PER_SECOND
+                for chunk in chunks
+            ]
+            values = np.sort(np.concatenate(differences)) if differences else []
+        else:
+            values = sorted(
+                (row[0] - row[1]) / NS_PER_SECOND for chunk in chunks for row in chunk
+            )
+        stats = _percentile_stats(values)
+        stats["source"] = "mmap_log"
+        return stats
+
+    def client_stats(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> list:
+        groups: dict = {}
+        if np is not None:
+            chunks = self._scan(start, end)
+            records = np.concatenate(chunks) if chunks else None
+            if records is not None:
+                records = records[records["client_id"] >= 0]
+                for client_id in np.unique(records["client_id"]).tolist():
+                    rows = records[records["client_id"] == client_id]
+                    total = (rows["server_ns"] - rows["payload_ns"]) / NS_PER_SECOND
+                    brokered = rows[rows["broker_ns"] != NULL_NS]
+                    to_broker = brokered["broker_ns"] - brokered["payload_ns"]
+                    to_webhook = brokered["server_ns"] - brokered["broker_ns"]
+                    groups[client_id] = (
+                        total.tolist(),
+                        (to_broker / NS_PER_SECOND).tolist(),
+                        (to_webhook / NS_PER_SECOND).tolist(),
+                    )
+        else:
+            for chunk in self._scan(start, end):
+                for server_ns, payload_ns, broker_ns, _, _, client_id, _, _ in chunk:
+                    if client_id < 0:
+                        continue
+                    total, to_broker, to_webhook = groups.setdefault(
+                        client_id, ([], [], [])
+                    )
+                    total.append((server_ns - payload_ns) / NS_PER_SECOND)
+                    if broker_ns != NULL_NS:
+                        to_broker.append((broker_ns - payload_ns) / NS_PER_SECOND)
+                        to_webhook.append((server_ns - broker_ns) / NS_PER_SECOND)
+
+        return [
+            {
+                "clientid": self.clients.name(client_id),
+                "count": len(total),
+                "mean": _mean(total),
+                "min": min(total),
+                "max": max(total),
+                "device_to_broker_mean": _mean(to_broker),
+                "broker_to_webhook_mean": _mean(to_webhook),
+            }
+            for client_id, (total, to_broker, to_webhook) in groups.items()
+        ]
+
+    def flush(self) -> None:
+        with self._lock:
+            self.first_case.flush()
+            self.second_case.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self.first_case.flush()
+            self.second_case.flush()
+            self.first_case.close()
+            self.second_case.close()
@@ -3,7 +3,7 @@ import socket
 import struct
 import time
 import logging
-from typing import Optional
+from typing import Callable, List, Optional, Tuple
 from datetime import datetime, timedelta, timezone
 
 logger = logging.getLogger("uvicorn.error")
@@ -15,83 +15,133 @@ class NTPSync:
     Syncs with time.nist.gov and caches the time offset for efficient timestamp generation.
     """
 
-    def __init__(self, ntp_server: str = "time.nist.gov", cache_duration: int = 30):
+    def __init__(
+        self,
+        ntp_server: str = "time.nist.gov",
+        cache_duration: int = 30,
+        trusted_duration: int = 300,
+    ):
         """
         Initialize NTP synchronizer.
 
         Args:
             ntp_server: NTP server hostname (default: time.nist.gov)
             cache_duration: Cache duration in seconds (default: 30 seconds)
+            trusted_duration: How long after the last successful sync
+                timestamps are considered trustworthy (default: 300 seconds)
         """
         self.ntp_server = ntp_server
         self.cache_duration = cache_duration
+        self.trusted_duration = trusted_duration
         self.time_offset: Optional[float] = None
         self.last_sync_time: Optional[float] = None
+        # Local time of the last sync that reached the NTP server; failed
+        # syncs fall back to local time and leave it unset
+        self.last_success_time: Optional[float] = None
+        # Incremented on every sync attempt that updates the offset
+        self.sync_generation = 0
+        # Callbacks receiving each successful sync sample
+        self.sync_listeners: List[Callable[[dict], None]] = []
         self._sync_lock = asyncio.Lock()
 
-    async def _get_ntp_time(self) -> float:
+    async def _get_ntp_time(self) -> Tuple[float, float, float]:
         """
-        Get NTP time from the server.
+        Get NTP time from the server. The blocking socket exchange runs in a
+        worker thread, so a slow or unreachable server does not stall the
+        event loop.
 
         Returns:
-            NTP timestamp as float
+            Tuple of the NTP transmit timestamp and the local times the
+            request was sent and the response received
 
         Raises:
             Exception: If NTP sync fails
         """
-        # NTP packet format
-        ntp_packet = b"\x1b" + 47 * b"\0"
-
         try:
-            # Create socket and set timeout
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            sock.settimeout(5.0)  # 5 second timeout
-
-            # Send NTP request
-            sock.sendto(ntp_packet, (self.ntp_server, 123))
-
-            # Receive response
-            response, _ = sock.recvfrom(1024)
-            sock.close()
+            response, send_time, receive_time = await asyncio.to_thread(
+                self._exchange
+            )
 
-            # Extract timestamp from NTP response (bytes 40-43 for seconds)
-            ntp_timestamp = struct.unpack("!12I", response)[10]
+            # Extract transmit timestamp from NTP response
+            # (bytes 40-43 for seconds, 44-47 for the fraction)
+            words = struct.unpack("!12I", response[:48])
+            ntp_timestamp = words[10] + words[11] / 2**32
 
             # Convert from NTP epoch (1900) to Unix epoch (1970)
             # NTP epoch starts at 1900-01-01, Unix epoch at 1970-01-01
             # Difference is 70 years = 2208988800 seconds
             unix_timestamp = ntp_timestamp - 2208988800
 
-            return float(unix_timestamp)
+            return float(unix_timestamp), send_time, receive_time
 
         except Exception as e:
             raise Exception(
                 f"Failed to sync with NTP server {self.ntp_server}: {str(e)}"
             )
 
+    def _exchange(self) -> Tuple[bytes, float, float]:
+        """
+        Send an NTP request and wait for the response (blocking).
+
+        Returns:
+            Tuple of the raw response and the local send and receive times
+        """
+        # NTP packet format
+        ntp_packet = b"\x1b" + 47 * b"\0"
+
+        # Create socket and set timeout
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(5.0)  # 5 second timeout
+
+            # Send NTP request
+            send_time = time.time()
+            sock.sendto(ntp_packet, (self.ntp_server, 123))
+
+            # Receive response
+            response, _ = sock.recvfrom(1024)
+            receive_time = time.time()
+
+        return response, send_time, receive_time
+
     async def _sync_time_offset(self) -> None:
         """
         Synchronize with NTP server and calculate time offset.
+        Successful samples are passed to every callback in sync_listeners.
         """
         try:
-            # Get current local time
-            local_time = time.time()
-
             # Get NTP time
-            ntp_time = await self._get_ntp_time()
+            ntp_time, send_time, receive_time = await self._get_ntp_time()
+
+            # The server stamped its reply roughly half way through the round trip
+            local_time = (send_time + receive_time) / 2
 
             # Calculate offset
             self.time_offset = ntp_time - local_time
             self.last_sync_time = local_time
+            self.last_success_time = local_time
+            self.sync_generation += 1
 
             logger.debug(f"NTP sync successful. Offset: {self.time_offset:.3f}s")
 
+            sample = {
+                "local_time": local_time,
+                "offset": self.time_offset,
+                "delay": receive_time - send_time,
+                "server": self.ntp_server,
+            }
+            for listener in self.sync_listeners:
+                try:
+                    listener(sample)
+                except Exception as e:
+                    logger.debug(f"NTP sync listener failed: {e}")
+
         except Exception as e:
             logger.debug(f"NTP sync failed: {e}")
             # If sync fails, we'll use local time (offset = 0)
             if self.time_offset is None:
                 self.time_offset = 0.0
                 self.last_sync_time = time.time()
+                self.sync_generation += 1
 
     async def get_ntp_timestamp(self) -> float:
         """
@@ -133,6 +183,18 @@ class NTPSync:
         timestamp = await self.get_ntp_timestamp()
         return datetime.fromtimestamp(timestamp, tz=timezone.utc)
 
+    def is_trusted(self) -> bool:
+        """
+        Whether timestamps come from a recent successful NTP sync, rather
+        than from the local clock fallback or a long-stale offset.
+
+        Returns:
+            True if the last successful sync is within trusted_duration
+        """
+        if self.last_success_time is None:
+            return False
+        return time.time() - self.last_success_time <= self.trusted_duration
+
     def get_cache_status(self) -> dict:
         """
         Get current cache status for debugging.
@@ -141,7 +203,12 @@ class NTPSync:
             Dictionary with cache status information
         """
         if self.last_sync_time is None or self.time_offset is None:
-            return {"status": "not_synced", "offset": None, "age": None}
+            return {
+                "status": "not_synced",
+                "offset": None,
+                "age": None,
+                "trusted": False,
+            }
 
         age = time.time() - self.last_sync_time
         is_valid = age <= self.cache_duration
@@ -151,6 +218,7 @@ class NTPSync:
             "offset": self.time_offset,
             "age_seconds": age,
             "cache_duration": self.cache_duration,
+            "trusted": self.is_trusted(),
             "last_sync": datetime.fromtimestamp(
                 self.last_sync_time, tz=timezone.utc
             ).isoformat(),
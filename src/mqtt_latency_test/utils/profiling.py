@@ -0,0 +1,168 @@
+import os
+import sys
+import threading
+import time
+import logging
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Optional
+
+logger = logging.getLogger("uvicorn.error")
+
+# Per-request stage timings are only collected when this is enabled
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").strip().lower() in (
+    "1",
+    "true",
+    "yes",
+)
+PROFILING_BUFFER_SIZE = int(os.getenv("PROFILING_BUFFER_SIZE", "1000"))
+# Upper bound for a single sampling profile
+PROFILE_MAX_SECONDS = 60.0
+
+# Most recent per-request timing records
+request_timings: deque = deque(maxlen=PROFILING_BUFFER_SIZE)
+
+# Stage timings of the request being handled in the current context
+_current_timings: ContextVar[Optional[dict]] = ContextVar(
+    "current_timings", default=None
+)
+
+
+class _Stage:
+    """Context manager adding its elapsed time to the current request."""
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        timings = _current_timings.get()
+        if timings is not None:
+            elapsed = time.perf_counter_ns() - self.start
+            timings[self.name] = timings.get(self.name, 0) + elapsed
+        return False
+
+
+class _NoopStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_STAGE = _NoopStage()
+
+
+def stage(name: str):
+    """
+    Time a stage of the current request, e.g. `with stage("decrypt"): ...`.
+    Returns a shared no-op context manager when profiling is disabled.
+    """
+    if not PROFILING_ENABLED:
+        return _NOOP_STAGE
+    return _Stage(name)
+
+
+def start_request_timing() -> tuple:
+    """Start collecting stage timings for the current context."""
+    timings: dict = {}
+    token = _current_timings.set(timings)
+    return token, timings
+
+
+def finish_request_timing(
+    token, timings: dict, method: str, path: str, status: int, total_ns: int
+) -> None:
+    """Store the finished request in the ring buffer."""
+    _current_timings.reset(token)
+    request_timings.append(
+        {
+            "at": time.time(),
+            "method": method,
+            "path": path,
+            "status": status,
+            "total_ms": total_ns / 1e6,
+            "stages_ms": {name: ns / 1e6 for name, ns in timings.items()},
+        }
+    )
+
+
+def summarize_timings() -> dict:
+    """
+    Summarize the ring buffer per path and stage.
+
+    Returns:
+        dict: count, mean and max in milliseconds for each path/stage
+    """
+    summary: dict = {}
+    for record in list(request_timings):
+        path_summary = summary.setdefault(record["path"], {})
+        values = dict(record["stages_ms"], total=record["total_ms"])
+        for name, value in values.items():
+            entry = path_summary.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+            entry["count"] += 1
+            entry["sum"] += value
+            entry["max"] = max(entry["max"], value)
+
+    for path_summary in summary.values():
+        for entry in path_summary.values():
+            entry["mean"] = entry.pop("sum") / entry["count"]
+    return summary
+
+
+_profile_lock = threading.Lock()
+
+
+def sample_profile(duration: float, interval: float = 0.005) -> Optional[str]:
+    """
+    Sample the stacks of all threads for a fixed duration.
+
+    Blocks the calling thread, so run it in a worker thread. Only one
+    profile may run at a time.
+
+    Args:
+        duration: Seconds to sample for (capped at PROFILE_MAX_SECONDS)
+        interval: Seconds between samples
+
+    Returns:
+        str: Collapsed stacks ("frame;frame;frame count" per line), as
+        consumed by flamegraph.pl and speedscope, or None if a profile is
+        already running
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return None
+
+    try:
+        duration = min(max(duration, 0.0), PROFILE_MAX_SECONDS)
+        interval = max(interval, 0.001)
+        own_thread = threading.get_ident()
+        thread_names = {t.ident: t.name for t in threading.enumerate()}
+        stacks: Counter = Counter()
+
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                names.append(thread_names.get(thread_id, str(thread_id)))
+                stacks[";".join(reversed(names))] += 1
+            time.sleep(interval)
+
+        return "\n".join(f"{stack} {count}" for stack, count in stacks.items()) + "\n"
+    finally:
+        _profile_lock.release()
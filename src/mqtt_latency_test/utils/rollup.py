@@ -0,0 +1,454 @@
+import json
+import math
+import os
+import sqlite3
+import time
+import logging
+from typing import Optional
+
+from .database import (
+    DATABASE_SCHEMA,
+    FIRST_CASE_TABLE,
+    NS_PER_SECOND,
+    create_connection,
+    close_connection,
+)
+
+logger = logging.getLogger("uvicorn.error")
+
+# Raw rows older than this many seconds are pruned once rolled up (0 disables)
+ROLLUP_RETENTION_SECONDS = int(os.getenv("ROLLUP_RETENTION_SECONDS", "0"))
+# Seconds between background maintenance passes
+ROLLUP_INTERVAL = int(os.getenv("ROLLUP_INTERVAL", "60"))
+# Stats ranges up to this many seconds are computed from raw rows
+STATS_RAW_MAX_RANGE = int(os.getenv("STATS_RAW_MAX_RANGE", "3600"))
+# Stats ranges up to this many seconds use minute rollups, longer ones hourly
+STATS_MINUTE_MAX_RANGE = int(os.getenv("STATS_MINUTE_MAX_RANGE", "172800"))
+
+ROLLUP_TABLES = {
+    60: "first_case_rollup_minute",
+    3600: "first_case_rollup_hour",
+}
+
+# Column used for time ranges in the physical table, and its unit
+if DATABASE_SCHEMA == "compact":
+    _TIME_COLUMN = "server_ns"
+    _TIME_SCALE = NS_PER_SECOND
+    _DIFFERENCE_SQL = "(server_ns - payload_ns) / 1e9"
+else:
+    _TIME_COLUMN = "server_timestamp_epoch"
+    _TIME_SCALE = 1
+    _DIFFERENCE_SQL = "difference"
+
+
+class LatencySketch:
+    """
+    Mergeable percentile sketch with bounded relative error.
+
+    Values are counted in logarithmically sized buckets, so any quantile is
+    reported within `relative_accuracy` of its true value. Negative values
+    (possible with clock skew) are tracked in a mirrored set of buckets.
+    Quantiles are clamped to the observed min/max, as a bucket's value can
+    lie beyond the values actually counted in it.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-6):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive: dict = {}
+        self.negative: dict = {}
+        self.zero = 0
+        self.count = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def _index(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, index: int) -> float:
+        return 2 * self.gamma**index / (self.gamma + 1)
+
+    def add(self, value: float, count: int = 1) -> None:
+        """Add a value to the sketch."""
+        if value > self.min_value:
+            index = self._index(value)
+            self.positive[index] = self.positive.get(index, 0) + count
+        elif value < -self.min_value:
+            index = self._index(-value)
+            self.negative[index] = self.negative.get(index, 0) + count
+        else:
+            self.zero += count
+        self.count += count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: "LatencySketch") -> None:
+        """Merge another sketch into this one."""
+        for index, count in other.positive.items():
+            self.positive[index] = self.positive.get(index, 0) + count
+        for index, count in other.negative.items():
+            self.negative[index] = self.negative.get(index, 0) + count
+        self.zero += other.zero
+        self.count += other.count
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        if other.max is not None:
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Return the approximate q-quantile (0 <= q <= 1)."""
+        if self.count == 0:
+            return None
+
+        value = self._bucket_quantile(q)
+        if self.min is not None:
+            value = max(value, self.min)
+        if self.max is not None:
+            value = min(value, self.max)
+        return value
+
+    def _bucket_quantile(self, q: float) -> float:
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return -self._value(index)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return self._value(index)
+        return self._value(max(self.positive)) if self.positive else 0.0
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "a": self.relative_accuracy,
+                "p": self.positive,
+                "n": self.negative,
+                "z": self.zero,
+                "lo": self.min,
+                "hi": self.max,
+            },
+            separators=(",", ":"),
+        )
+
+    @classmethod
+    def from_json(cls, data: str) -> "LatencySketch":
+        raw = json.loads(data)
+        sketch = cls(relative_accuracy=raw["a"])
+        sketch.positive = {int(k): v for k, v in raw["p"].items()}
+        sketch.negative = {int(k): v for k, v in raw["n"].items()}
+        sketch.zero = raw["z"]
+        sketch.count = sum(sketch.positive.values()) + sum(
+            sketch.negative.values()
+        ) + sketch.zero
+        # Absent from sketches stored before min/max were tracked
+        sketch.min = raw.get("lo")
+        sketch.max = raw.get("hi")
+        return sketch
+
+
+class LatencyAggregate:
+    """Count, min, max, sum, sum of squares and sketch of latency values."""
+
+    def __init__(self):
+        self.count = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.sum = 0.0
+        self.sum_sq = 0.0
+        self.sketch = LatencySketch()
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.sum += value
+        self.sum_sq += value * value
+        self.sketch.add(value)
+
+    def merge(self, other: "LatencyAggregate") -> None:
+        if other.count == 0:
+            return
+        self.count += other.count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.sum += other.sum
+        self.sum_sq += other.sum_sq
+        self.sketch.merge(other.sketch)
+
+    @classmethod
+    def from_row(cls, row: tuple) -> "LatencyAggregate":
+        aggregate = cls()
+        (
+            aggregate.count,
+            aggregate.min,
+            aggregate.max,
+            aggregate.sum,
+            aggregate.sum_sq,
+            sketch,
+        ) = row
+        aggregate.sketch = LatencySketch.from_json(sketch)
+        aggregate.sketch.min = aggregate.min
+        aggregate.sketch.max = aggregate.max
+        return aggregate
+
+    def to_stats(self) -> dict:
+        """Summarize the aggregate as a stats dictionary."""
+        if self.count == 0:
+            return {"count": 0}
+
+        mean = self.sum / self.count
+        variance = max(self.sum_sq / self.count - mean * mean, 0.0)
+        return {
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "mean": mean,
+            "stddev": math.sqrt(variance),
+            "p50": self.sketch.quantile(0.5),
+            "p90": self.sketch.quantile(0.9),
+            "p99": self.sketch.quantile(0.99),
+        }
+
+
+def _get_watermark(conn: sqlite3.Connection) -> int:
+    cursor = conn.execute("SELECT last_id FROM rollup_state WHERE name = 'first_case'")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def rollup_pending_rows(conn: sqlite3.Connection, batch_size: int = 5000) -> int:
+    """
+    Fold the next batch of raw rows past the watermark into the rollups.
+
+    Args:
+        conn: Database connection
+        batch_size: Maximum raw rows to read
+
+    Returns:
+        int: Number of raw rows processed
+    """
+
+    with conn:
+        last_id = _get_watermark(conn)
+        cursor = conn.execute(
+            f"""
+            SELECT id, {_TIME_COLUMN}, {_DIFFERENCE_SQL}
+            FROM {FIRST_CASE_TABLE}
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+            """,
+            (last_id, batch_size),
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return 0
+
+        for width, table in ROLLUP_TABLES.items():
+            buckets: dict = {}
+            for _, server_time, difference in rows:
+                if server_time is None or difference is None:
+                    continue
+                bucket = int(server_time / _TIME_SCALE) // width * width
+                buckets.setdefault(bucket, LatencyAggregate()).add(difference)
+
+            for bucket, aggregate in buckets.items():
+                cursor = conn.execute(
+                    f"SELECT count, min, max, sum, sum_sq, sketch FROM {table} WHERE bucket = ?",
+                    (bucket,),
+                )
+                existing = cursor.fetchone()
+                if existing:
+                    merged = LatencyAggregate.from_row(existing)
+                    merged.merge(aggregate)
+                    aggregate = merged
+                conn.execute(
+                    f"""
+                    INSERT OR REPLACE INTO {table}
+                        (bucket, count, min, max, sum, sum_sq, sketch)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        bucket,
+                        aggregate.count,
+                        aggregate.min,
+                        aggregate.max,
+                        aggregate.sum,
+                        aggregate.sum_sq,
+                        aggregate.sketch.to_json(),
+                    ),
+                )
+
+        conn.execute(
+            "INSERT OR REPLACE INTO rollup_state (name, last_id) VALUES ('first_case', ?)",
+            (rows[-1][0],),
+        )
+
+    return len(rows)
+
+
+def prune_raw_rows(
+    conn: sqlite3.Connection,
+    retention_seconds: int,
+    batch_size: int = 500,
+    pause: float = 0.05,
+) -> int:
+    """
+    Delete rolled-up raw rows older than the retention period.
+
+    Rows are deleted in small batches, each in its own short transaction,
+    with a pause in between so ingestion never waits long for the write lock.
+
+    Args:
+        conn: Database connection
+        retention_seconds: Age in seconds after which raw rows are pruned
+        batch_size: Rows deleted per transaction
+        pause: Seconds to sleep between batches
+
+    Returns:
+        int: Number of rows deleted
+    """
+
+    cutoff = (time.time() - retention_seconds) * _TIME_SCALE
+    deleted = 0
+    while True:
+        with conn:
+            watermark = _get_watermark(conn)
+            cursor = conn.execute(
+                f"""
+                DELETE FROM {FIRST_CASE_TABLE}
+                WHERE id IN (
+                    SELECT id FROM {FIRST_CASE_TABLE}
+                    WHERE {_TIME_COLUMN} < ? AND id <= ?
+                    LIMIT ?
+                )
+                """,
+                (cutoff, watermark, batch_size),
+            )
+            deleted += cursor.rowcount
+
+        if cursor.rowcount < batch_size:
+            break
+        time.sleep(pause)
+
+    if deleted:
+        logger.debug(f"Pruned {deleted} raw rows older than {retention_seconds}s")
+    return deleted
+
+
+def run_maintenance(db_file: Optional[str] = None) -> dict:
+    """
+    Roll up all pending raw rows, then prune expired raw rows.
+
+    Args:
+        db_file: Database file (default: DATABASE_PATH)
+
+    Returns:
+        dict: Number of rows rolled up and pruned
+    """
+
+    conn = create_connection(db_file)
+    if not conn:
+        return {"rolled_up": 0, "pruned": 0}
+
+    rolled_up = 0
+    pruned = 0
+    try:
+        while True:
+            processed = rollup_pending_rows(conn)
+            rolled_up += processed
+            if processed == 0:
+                break
+
+        if ROLLUP_RETENTION_SECONDS > 0:
+            pruned = prune_raw_rows(conn, ROLLUP_RETENTION_SECONDS)
+    finally:
+        close_connection(conn)
+
+    return {"rolled_up": rolled_up, "pruned": pruned}
+
+
+def get_latency_stats(
+    conn: sqlite3.Connection,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+) -> dict:
+    """
+    Get latency statistics for a time range.
+
+    Short ranges are computed exactly from raw rows. Longer ranges read the
+    minute or hour rollups, plus any raw rows not rolled up yet, so results
+    are aligned to bucket boundaries and percentiles are approximate.
+
+    Args:
+        conn: Database connection
+        start: Range start, epoch seconds (default: beginning of data)
+        end: Range end, epoch seconds (default: now)
+
+    Returns:
+        dict: Stats and the source they were computed from
+    """
+
+    if end is None:
+        end = time.time()
+    if start is None:
+        start = 0.0
+
+    span = end - start
+    if span <= STATS_RAW_MAX_RANGE:
+        cursor = conn.execute(
+            f"""
+            SELECT {_DIFFERENCE_SQL} FROM {FIRST_CASE_TABLE}
+            WHERE {_TIME_COLUMN} >= ? AND {_TIME_COLUMN} < ?
+            """,
+            (start * _TIME_SCALE, end * _TIME_SCALE),
+        )
+        values = sorted(row[0] for row in cursor.fetchall() if row[0] is not None)
+        aggregate = LatencyAggregate()
+        for value in values:
+            aggregate.add(value)
+        stats = aggregate.to_stats()
+        if values:
+            # Exact percentiles for raw ranges
+            for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+                stats[name] = values[min(int(q * len(values)), len(values) - 1)]
+        stats["source"] = "raw"
+        return stats
+
+    width = 60 if span <= STATS_MINUTE_MAX_RANGE else 3600
+    table = ROLLUP_TABLES[width]
+
+    aggregate = LatencyAggregate()
+    cursor = conn.execute(
+        f"""
+        SELECT count, min, max, sum, sum_sq, sketch FROM {table}
+        WHERE bucket >= ? AND bucket < ?
+        """,
+        (int(start) // width * width, end),
+    )
+    for row in cursor.fetchall():
+        aggregate.merge(LatencyAggregate.from_row(row))
+
+    # Rows ingested since the last maintenance pass
+    cursor = conn.execute(
+        f"""
+        SELECT {_DIFFERENCE_SQL} FROM {FIRST_CASE_TABLE}
+        WHERE id > ? AND {_TIME_COLUMN} >= ? AND {_TIME_COLUMN} < ?
+        """,
+        (_get_watermark(conn), start * _TIME_SCALE, end * _TIME_SCALE),
+    )
+    for (difference,) in cursor.fetchall():
+        if difference is not None:
+            aggregate.add(difference)
+
+    stats = aggregate.to_stats()
+    stats["source"] = table
+    return stats
@@ -0,0 +1,200 @@
+import os
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+from .database import RUN_ID
+
+logger = logging.getLogger("uvicorn.error")
+
+# Iterations tracked behind the highest one seen, per stream
+SEQUENCE_WINDOW = int(os.getenv("SEQUENCE_WINDOW", "4096"))
+# Streams (run/client/case) tracked at once; the least recent are evicted
+SEQUENCE_MAX_STREAMS = int(os.getenv("SEQUENCE_MAX_STREAMS", "1024"))
+# Skip the database write for duplicate iterations
+SEQUENCE_DROP_DUPLICATES = os.getenv(
+    "SEQUENCE_DROP_DUPLICATES", "false"
+).strip().lower() in ("1", "true", "yes")
+
+NEW = "new"
+REORDERED = "reordered"
+DUPLICATE = "duplicate"
+LATE = "late"
+
+
+class SequenceStream:
+    """
+    Duplicate, loss and reordering detection for one iteration sequence.
+
+    Keeps a sliding bitmap of the last `window` iterations below the highest
+    one seen (bit i set = iteration highest - i received), so memory stays
+    constant however long the run is. Gaps that slide out of the window
+    unfilled are counted as lost; arrivals older than the window are "late"
+    and can no longer be classified.
+    """
+
+    __slots__ = (
+        "window",
+        "first",
+        "highest",
+        "bitmap",
+        "received",
+        "duplicates",
+        "reordered",
+        "late",
+        "lost",
+        "reorder_histogram",
+    )
+
+    def __init__(self, window: int = SEQUENCE_WINDOW):
+        self.window = window
+        self.first: Optional[int] = None
+        self.highest: Optional[int] = None
+        self.bitmap = 0
+        self.received = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.late = 0
+        self.lost = 0
+        # Bucket b counts reorder distances in [2**(b-1), 2**b)
+        self.reorder_histogram = [0] * (window.bit_length() + 1)
+
+    def _valid(self) -> int:
+        return min(self.window, self.highest - self.first + 1)
+
+    def observe(self, iteration: int) -> str:
+        """
+        Record an iteration number.
+
+        Returns:
+            str: "new", "reordered", "duplicate" or "late"
+        """
+        if self.highest is None:
+            self.first = self.highest = iteration
+            self.bitmap = 1
+            self.received = 1
+            return NEW
+
+        if iteration > self.highest:
+            shift = iteration - self.highest
+            valid = self._valid()
+            kept = min(self.window, valid + shift)
+            evicted = valid + shift - kept
+            old_evicted = min(valid, evicted)
+            if old_evicted:
+                evicted_bits = self.bitmap >> (valid - old_evicted)
+                self.lost += evicted - evicted_bits.bit_count()
+            else:
+                self.lost += evicted
+
+            if shift >= self.window:
+                self.bitmap = 1
+            else:
+                self.bitmap = ((self.bitmap << shift) | 1) & ((1 << self.window) - 1)
+            self.highest = iteration
+            self.received += 1
+            return NEW
+
+        distance = self.highest - iteration
+        if distance >= self.window:
+            self.late += 1
+            return LATE
+
+        bit = 1 << distance
+        if iteration >= self.first and self.bitmap & bit:
+            self.duplicates += 1
+            return DUPLICATE
+
+        if iteration < self.first:
+            # Earlier than the first iteration seen, but still inside the window
+            self.first = iteration
+        self.bitmap |= bit
+        self.received += 1
+        self.reordered += 1
+        self.reorder_histogram[distance.bit_length()] += 1
+        return REORDERED
+
+    def stats(self) -> dict:
+        if self.highest is None:
+            return {"received": 0}
+
+        expected = self.highest - self.first + 1
+        missing_in_window = self._valid() - self.bitmap.bit_count()
+        return {
+            "first": self.first,
+            "highest": self.highest,
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "reordered": self.reordered,
+            "late": self.late,
+            "lost": self.lost,
+            "missing_in_window": missing_in_window,
+            "loss_rate": (self.lost + missing_in_window) / expected,
+            "reorder_histogram": {
+                (f"{2 ** (b - 1)}-{2 ** b - 1}" if b > 1 else "1"): count
+                for b, count in enumerate(self.reorder_histogram)
+                if count
+            },
+        }
+
+
+class SequenceTracker:
+    """Sequence streams keyed by (run, client, case), bounded by LRU eviction."""
+
+    def __init__(
+        self, window: int = SEQUENCE_WINDOW, max_streams: int = SEQUENCE_MAX_STREAMS
+    ):
+        self.window = window
+        self.max_streams = max_streams
+        self.streams: OrderedDict = OrderedDict()
+        self.evicted = 0
+
+    def observe(
+        self,
+        case: str,
+        client: Optional[str],
+        iteration,
+        run_id: int = RUN_ID,
+    ) -> Optional[str]:
+        """
+        Record an iteration for the (run, client, case) stream.
+
+        Args:
+            case: "first_case" or "second_case"
+            client: MQTT client id, if known
+            iteration: Iteration number from the payload
+            run_id: Run identifier
+
+        Returns:
+            str: The classification, or None if iteration is not an integer
+        """
+        if not isinstance(iteration, int) or isinstance(iteration, bool):
+            return None
+
+        key = (run_id, client, case)
+        stream = self.streams.get(key)
+        if stream is None:
+            stream = self.streams[key] = SequenceStream(self.window)
+            if len(self.streams) > self.max_streams:
+                self.streams.popitem(last=False)
+                self.evicted += 1
+        else:
+            self.streams.move_to_end(key)
+
+        return stream.observe(iteration)
+
+    def stats(self) -> dict:
+        streams = []
+        for (run_id, client, case), stream in self.streams.items():
+            streams.append(
+                {"run_id": run_id, "clientid": client, "case": case, **stream.stats()}
+            )
+        return {
+            "window": self.window,
+            "evicted_streams": self.evicted,
+            "drop_duplicates": SEQUENCE_DROP_DUPLICATES,
+            "streams": streams,
+        }
+
+
+sequence_tracker = SequenceTracker()
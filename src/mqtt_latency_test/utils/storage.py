@@ -0,0 +1,242 @@
+import os
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Hashable, Optional
+
+from .database import (
+    FIRST_CASE_SELECT_SQL,
+    create_connection,
+    close_connection,
+    insert_first_case_data,
+    insert_second_case_data,
+    fetch_first_case_data,
+    fetch_first_case_version,
+    fetch_client_stats,
+    format_first_case_row,
+)
+from .async_database import async_db, DB_STREAM_BATCH_SIZE
+from .rollup import get_latency_stats
+
+logger = logging.getLogger("uvicorn.error")
+
+# Latency row storage: "sqlite" (default) or "mmap" (append-only binary log)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite").strip().lower()
+if STORAGE_BACKEND not in ("sqlite", "mmap"):
+    STORAGE_BACKEND = "sqlite"
+
+
+class StorageBackend(ABC):
+    """
+    Interface for storing and reading latency rows.
+
+    Only the first_case/second_case rows go through the backend; NTP
+    history, rollups and anomalies always live in the SQLite database.
+    Backends implement the synchronous methods; a backend missing one
+    cannot be instantiated.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def insert_first_case(
+        self,
+        iteration: Optional[int],
+        payload_timestamp_iso: Optional[str],
+        payload_timestamp_epoch: Optional[float],
+        server_timestamp_iso: Optional[str],
+        server_timestamp_epoch: Optional[float],
+        difference: Optional[float],
+        client: Optional[str] = None,
+        topic: Optional[str] = None,
+        qos: Optional[int] = None,
+        broker_timestamp_epoch: Optional[float] = None,
+    ) -> bool:
+        """Store a first_case row. Returns True if successful."""
+
+    @abstractmethod
+    def insert_second_case(
+        self,
+        iteration: Optional[int],
+        server_timestamp_iso: Optional[str],
+        server_timestamp_epoch: Optional[float],
+    ) -> bool:
+        """Store a second_case row. Returns True if successful."""
+
+    @abstractmethod
+    def fetch_first_case(self) -> list:
+        """All first_case rows, newest first, in the /message/data format."""
+
+    @abstractmethod
+    def latency_stats(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> dict:
+        """Latency statistics for first_case rows in [start, end)."""
+
+    @abstractmethod
+    def client_stats(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> list:
+        """Per-client latency statistics for first_case rows in [start, end)."""
+
+    # Awaitable versions used on the event loop. By default inserts run
+    # inline, which suits backends that only append to memory, and reads
+    # run in a worker thread.
+
+    async def insert_first_case_async(self, **row) -> bool:
+        return self.insert_first_case(**row)
+
+    async def insert_second_case_async(self, **row) -> bool:
+        return self.insert_second_case(**row)
+
+    async def fetch_first_case_async(self) -> list:
+        return await asyncio.to_thread(self.fetch_first_case)
+
+    async def latency_stats_async(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> dict:
+        return await asyncio.to_thread(self.latency_stats, start=start, end=end)
+
+    async def client_stats_async(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> list:
+        return await asyncio.to_thread(self.client_stats, start=start, end=end)
+
+    @abstractmethod
+    async def data_version_async(self) -> Hashable:
+        """
+        Version of the first_case rows, changing whenever fetch_first_case()
+        would return something else. Keys the /message/data cache.
+        """
+
+    async def stream_first_case_async(
+        self, batch_size: int = DB_STREAM_BATCH_SIZE
+    ) -> AsyncIterator[list]:
+        """Yield first_case rows, newest first, in batches of dictionaries."""
+        rows = await self.fetch_first_case_async()
+        for offset in range(0, len(rows), batch_size):
+            yield rows[offset : offset + batch_size]
+
+    def flush(self) -> None:
+        """Make written rows durable."""
+
+    def close(self) -> None:
+        """Release files and connections."""
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    The SQLite database from database.py. Synchronous calls open one
+    connection per call; the awaitable ones go through async_db.
+    """
+
+    name = "sqlite"
+
+    def insert_first_case(self, **row) -> bool:
+        conn = create_connection()
+        if not conn:
+            return False
+        try:
+            return insert_first_case_data(conn=conn, **row)
+        finally:
+            close_connection(conn)
+
+    def insert_second_case(self, **row) -> bool:
+        conn = create_connection()
+        if not conn:
+            return False
+        try:
+            return insert_second_case_data(conn=conn, **row)
+        finally:
+            close_connection(conn)
+
+    def fetch_first_case(self) -> list:
+        conn = create_connection()
+        if not conn:
+            raise RuntimeError("Failed to connect to database")
+        try:
+            return fetch_first_case_data(conn)
+        finally:
+            close_connection(conn)
+
+    def latency_stats(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> dict:
+        conn = create_connection()
+        if not conn:
+            raise RuntimeError("Failed to connect to database")
+        try:
+            return get_latency_stats(conn, start=start, end=end)
+        finally:
+            close_connection(conn)
+
+    def client_stats(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> list:
+        conn = create_connection()
+        if not conn:
+            raise RuntimeError("Failed to connect to database")
+        try:
+            return fetch_client_stats(conn, start=start, end=end)
+        finally:
+            close_connection(conn)
+
+    async def insert_first_case_async(self, **row) -> bool:
+        return await async_db.write(insert_first_case_data, **row)
+
+    async def insert_second_case_async(self, **row) -> bool:
+        return await async_db.write(insert_second_case_data, **row)
+
+    async def fetch_first_case_async(self) -> list:
+        return await async_db.read(fetch_first_case_data)
+
+    async def data_version_async(self) -> Hashable:
+        # Read from the database, so rows written by other workers or by
+        # the replay/migrate CLIs invalidate cached responses too
+        return await async_db.read(fetch_first_case_version)
+
+    async def latency_stats_async(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> dict:
+        return await async_db.read(get_latency_stats, start=start, end=end)
+
+    async def client_stats_async(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> list:
+        return await async_db.read(fetch_client_stats, start=start, end=end)
+
+    async def stream_first_case_async(
+        self, batch_size: int = DB_STREAM_BATCH_SIZE
+    ) -> AsyncIterator[list]:
+        async for rows in async_db.stream(
+            FIRST_CASE_SELECT_SQL, batch_size=batch_size
+        ):
+            yield [format_first_case_row(row) for row in rows]
+
+
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    """
+    Get the storage backend selected by STORAGE_BACKEND, opening it once.
+    Opened at startup, so the first webhooks do not pay for it.
+    """
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "mmap":
+            from .mmap_log import MmapLogBackend
+
+            _storage = MmapLogBackend()
+        else:
+            _storage = SQLiteBackend()
+        logger.debug(f"Storage backend: {_storage.name}")
+    return _storage
+
+
+def close_storage() -> None:
+    """Close the storage backend; the next get_storage() opens it again."""
+    global _storage
+    if _storage is not None:
+        _storage.close()
+        _storage = None
@@ -0,0 +1,57 @@
+import binascii
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+# Settings are read at import time, so they are set before the app is imported
+TEST_KEY_HEX = "11" * 32
+os.environ.setdefault("MQTT_ENCRYPTION_KEY", TEST_KEY_HEX)
+os.environ["DATABASE_PATH"] = os.path.join(
+    tempfile.mkdtemp(prefix="mqtt-latency-test-"), "database.db"
+)
+
+
+def encrypt_payload(payload: dict) -> str:
+    """Encrypt a payload the way the devices do (8-byte nonce, 8-byte counter)."""
+    from Crypto.Cipher import ChaCha20
+
+    key = binascii.unhexlify(os.environ["MQTT_ENCRYPTION_KEY"])
+    nonce = os.urandom(8)
+    cipher = ChaCha20.new(key=key, nonce=nonce)
+    ciphertext = cipher.encrypt(json.dumps(payload).encode())
+    return (nonce + (0).to_bytes(8, "little") + ciphertext).hex()
+
+
+def webhook_body(iteration: int, clientid: str = "test-device") -> dict:
+    """An EMQX webhook body carrying an encrypted latency payload."""
+    payload = {
+        "iteration": iteration,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+    return {"payload": encrypt_payload(payload), "clientid": clientid}
+
+
+@pytest.fixture
+def database():
+    """Initialize the test database; close the async layer afterwards."""
+    from src.mqtt_latency_test.utils import initialize_database, async_db
+
+    assert initialize_database()
+    yield os.environ["DATABASE_PATH"]
+    async_db.close()
+
+
+@pytest.fixture
+def synced_ntp():
+    """Pretend NTP is synced (offset 0), so no request touches the network."""
+    from src.mqtt_latency_test.utils import ntp_sync
+
+    saved = (ntp_sync.time_offset, ntp_sync.last_sync_time)
+    ntp_sync.time_offset = 0.0
+    ntp_sync.last_sync_time = time.time() + 3600
+    yield ntp_sync
+    ntp_sync.time_offset, ntp_sync.last_sync_time = saved
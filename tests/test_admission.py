@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import httpx
+
+from src.mqtt_latency_test.main import app
+from src.mqtt_latency_test.middleware import admissionMiddleware
+from src.mqtt_latency_test.utils.admission import (
+    AdmissionLimiter,
+    ADMISSION_REJECT_STATUS,
+    ADMISSION_RETRY_AFTER,
+)
+
+from .conftest import webhook_body
+
+MAX_IN_FLIGHT = 4
+MAX_QUEUE = 8
+QUEUE_TIMEOUT = 0.25
+BURST = 200
+# Admitted requests wait at most QUEUE_TIMEOUT for a slot, plus their own
+# processing time
+P99_BOUND = QUEUE_TIMEOUT + 0.5
+
+
+async def _burst(client: httpx.AsyncClient) -> list:
+    bodies = [webhook_body(i) for i in range(BURST)]
+
+    async def post(body):
+        started = time.perf_counter()
+        response = await client.post("/message/publish", json=body)
+        return response, time.perf_counter() - started
+
+    return await asyncio.gather(*(post(body) for body in bodies))
+
+
+def test_burst_is_shed_and_admitted_latency_stays_bounded(
+    monkeypatch, database, synced_ntp
+):
+    limiter = AdmissionLimiter(
+        max_in_flight=MAX_IN_FLIGHT, max_queue=MAX_QUEUE, queue_timeout=QUEUE_TIMEOUT
+    )
+    monkeypatch.setattr(admissionMiddleware, "admission", limiter)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await _burst(client)
+
+    results = asyncio.run(run())
+
+    admitted = [elapsed for response, elapsed in results if response.status_code == 200]
+    shed = [response for response, _ in results if response.status_code != 200]
+
+    assert admitted, "no request was admitted"
+    assert shed, "the burst exceeded the limit but nothing was shed"
+    assert len(admitted) + len(shed) == BURST
+
+    for response in shed:
+        assert response.status_code == ADMISSION_REJECT_STATUS == 503
+        assert response.headers["retry-after"] == str(ADMISSION_RETRY_AFTER)
+        assert response.json()["status"] == "error"
+
+    status = limiter.status()
+    assert status["shed"] == len(shed)
+    assert status["admitted"] == len(admitted)
+    assert status["in_flight"] == 0
+    assert status["peak_waiting"] <= MAX_QUEUE
+
+    admitted.sort()
+    p99 = admitted[min(int(len(admitted) * 0.99), len(admitted) - 1)]
+    assert p99 < P99_BOUND, f"admitted p99 {p99:.3f}s exceeds {P99_BOUND}s"
@@ -0,0 +1,99 @@
+import asyncio
+import sqlite3
+import time
+
+import httpx
+
+from src.mqtt_latency_test.main import app
+
+from .conftest import webhook_body
+
+# A /message/data body of this many rows takes seconds to read, encode and
+# compress, which used to stall the event loop for all of it
+LARGE_TABLE_ROWS = 100_000
+# Inserts continue until this many complete reads, so they cover every
+# step of a read, not only the database query
+COMPLETE_READS = 2
+INSERT_INTERVAL = 0.01
+INSERT_P99_BOUND = 0.25
+
+
+def _seed_rows(database_path: str, rows: int) -> None:
+    now = time.time()
+    with sqlite3.connect(database_path) as conn:
+        conn.executemany(
+            "INSERT INTO first_case (iteration, payload_timestamp_iso, "
+            "payload_timestamp_epoch, server_timestamp_iso, "
+            "server_timestamp_epoch, difference) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (i, "2026-01-01T00:00:00+00:00", now, "2026-01-01T00:00:00+00:00", now + 0.1, 0.1)
+                for i in range(rows)
+            ),
+        )
+
+
+async def _reads_during_inserts(client: httpx.AsyncClient) -> tuple:
+    reads = []
+    latencies = []
+    writing = True
+
+    async def reader():
+        while writing:
+            started = time.perf_counter()
+            # Read the raw body: decompressing and parsing it here would
+            # block the shared event loop on the client's side
+            async with client.stream(
+                "GET", "/message/data", headers={"Accept-Encoding": "gzip"}
+            ) as response:
+                assert response.status_code == 200
+                assert response.headers["content-encoding"] == "gzip"
+                await response.aread()
+            reads.append((started, time.perf_counter()))
+
+    async def insert(i, due):
+        response = await client.post("/message/publish", json=webhook_body(i))
+        # Measured from when the webhook was due, as the broker sees it: a
+        # blocked event loop delays sending as much as handling
+        latencies.append((due, time.perf_counter() - due))
+        assert response.json()["status"] == "success"
+
+    async def writer():
+        inserts = []
+        first_due = time.perf_counter()
+        while len(reads) < COMPLETE_READS:
+            due = first_due + len(inserts) * INSERT_INTERVAL
+            await asyncio.sleep(due - time.perf_counter())
+            inserts.append(asyncio.create_task(insert(len(inserts), due)))
+        await asyncio.gather(*inserts)
+
+    reading = asyncio.create_task(reader())
+    # Let the first read reach the database before inserting
+    await asyncio.sleep(0.05)
+    try:
+        await writer()
+    finally:
+        writing = False
+        await reading
+    return reads, latencies
+
+
+def test_large_read_does_not_delay_inserts(database, synced_ntp):
+    _seed_rows(database, LARGE_TABLE_ROWS)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await _reads_during_inserts(client)
+
+    reads, latencies = asyncio.run(run())
+
+    # Inserting started before the first read finished and went on until
+    # COMPLETE_READS reads had
+    assert len(reads) >= COMPLETE_READS
+    assert min(due for due, _ in latencies) < reads[0][1]
+
+    elapsed = sorted(latency for _, latency in latencies)
+    p99 = elapsed[min(int(len(elapsed) * 0.99), len(elapsed) - 1)]
+    assert p99 < INSERT_P99_BOUND, (
+        f"insert p99 {p99:.3f}s during large reads exceeds {INSERT_P99_BOUND}s"
+    )
@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+from src.mqtt_latency_test.main import app, lifespan, SHUTDOWN_DRAIN_TIMEOUT
+from src.mqtt_latency_test.utils import ntp_sync, anomaly_detector
+from src.mqtt_latency_test.utils.admission import admission
+from src.mqtt_latency_test.utils.anomaly import persist_anomaly
+from src.mqtt_latency_test.utils.correction import persist_ntp_sample
+
+BACKGROUND_TASKS = {"background_ntp_sync", "background_rollup_maintenance"}
+
+
+async def _lifespan_cycle() -> dict:
+    async with lifespan(app):
+        tasks = [
+            task
+            for task in asyncio.all_tasks()
+            if task.get_coro().__name__ in BACKGROUND_TASKS
+        ]
+        # Give the loops time to reach their shutdown wait
+        await asyncio.sleep(0.1)
+        running = [task for task in tasks if not task.done()]
+        listeners = (
+            ntp_sync.sync_listeners.count(persist_ntp_sample),
+            anomaly_detector.listeners.count(persist_anomaly),
+        )
+
+        # An in-flight ingestion request that shutdown has to wait for
+        assert await admission.acquire()
+        asyncio.get_running_loop().call_later(0.1, admission.release)
+
+        started = time.perf_counter()
+    shutdown_seconds = time.perf_counter() - started
+
+    return {
+        "tasks": tasks,
+        "running": running,
+        "listeners": listeners,
+        "shutdown_seconds": shutdown_seconds,
+    }
+
+
+def test_repeated_lifespans_on_new_event_loops(database, synced_ntp):
+    for _ in range(3):
+        # Every asyncio.run() starts a new event loop
+        result = asyncio.run(_lifespan_cycle())
+
+        assert {task.get_coro().__name__ for task in result["tasks"]} == BACKGROUND_TASKS
+        assert len(result["running"]) == len(result["tasks"])
+        assert result["listeners"] == (1, 1)
+
+        # Background loops stopped on the shutdown event, not by cancellation
+        for task in result["tasks"]:
+            assert task.done() and not task.cancelled()
+            assert task.exception() is None
+        assert result["shutdown_seconds"] < SHUTDOWN_DRAIN_TIMEOUT
+
+        assert persist_ntp_sample not in ntp_sync.sync_listeners
+        assert persist_anomaly not in anomaly_detector.listeners
+        assert admission.in_flight == 0
@@ -0,0 +1,171 @@
+import random
+import sqlite3
+import time
+
+import numpy as np
+import pytest
+
+from src.mqtt_latency_test.utils import rollup
+from src.mqtt_latency_test.utils.database import (
+    NS_PER_SECOND,
+    create_compact_tables,
+    create_rollup_tables,
+    insert_first_case_compact,
+)
+from src.mqtt_latency_test.utils.migrate import migrate_to_compact
+from src.mqtt_latency_test.utils.rollup import LatencyAggregate, LatencySketch
+
+QUANTILES = [0.0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 0.999, 1.0]
+
+
+def _assert_within_relative_error(sketch: LatencySketch, values: list) -> None:
+    for q in QUANTILES:
+        # The sketch reports the value of rank floor(q * (n - 1))
+        expected = np.percentile(values, q * 100, method="lower")
+        actual = sketch.quantile(q)
+        assert actual == pytest.approx(
+            expected, rel=sketch.relative_accuracy, abs=sketch.min_value
+        ), f"q={q}"
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_quantiles_match_numpy_within_relative_accuracy(seed):
+    rng = random.Random(seed)
+    values = [rng.lognormvariate(-3, 1.5) for _ in range(20_000)]
+    sketch = LatencySketch()
+    for value in values:
+        sketch.add(value)
+
+    _assert_within_relative_error(sketch, values)
+
+
+def test_quantiles_with_negative_values():
+    rng = random.Random(3)
+    values = [rng.gauss(0.0, 0.05) for _ in range(10_000)]
+    sketch = LatencySketch()
+    for value in values:
+        sketch.add(value)
+
+    _assert_within_relative_error(sketch, values)
+
+
+def test_quantiles_are_clamped_to_observed_range():
+    sketch = LatencySketch()
+    sketch.add(84883.24)
+
+    assert sketch.quantile(0.5) == 84883.24
+    assert sketch.quantile(0.0) == 84883.24
+    assert sketch.quantile(1.0) == 84883.24
+
+
+def test_merge_and_roundtrip_keep_range():
+    values = [0.1 * (i + 1) for i in range(100)]
+    left, right = LatencySketch(), LatencySketch()
+    for value in values[:50]:
+        left.add(value)
+    for value in values[50:]:
+        right.add(value)
+    left.merge(right)
+
+    restored = LatencySketch.from_json(left.to_json())
+    assert (restored.min, restored.max) == (values[0], values[-1])
+    assert restored.quantile(1.0) == values[-1]
+    _assert_within_relative_error(restored, values)
+
+
+def test_aggregate_from_row_clamps_legacy_sketches():
+    sketch = LatencySketch()
+    sketch.add(84883.24)
+    # Sketches stored before min/max were tracked have no range in the JSON
+    legacy = sketch.to_json().replace(',"lo":84883.24,"hi":84883.24', "")
+    assert '"lo"' not in legacy
+
+    aggregate = LatencyAggregate.from_row(
+        (1, 84883.24, 84883.24, 84883.24, 84883.24**2, legacy)
+    )
+    stats = aggregate.to_stats()
+    assert stats["p50"] <= stats["max"]
+    assert stats["p99"] == 84883.24
+
+
+@pytest.fixture
+def compact_rollup(monkeypatch):
+    """Point the rollup at the compact table, whatever DATABASE_SCHEMA is."""
+    monkeypatch.setattr(rollup, "FIRST_CASE_TABLE", "first_case_compact")
+    monkeypatch.setattr(rollup, "_TIME_COLUMN", "server_ns")
+    monkeypatch.setattr(rollup, "_TIME_SCALE", NS_PER_SECOND)
+    monkeypatch.setattr(rollup, "_DIFFERENCE_SQL", "(server_ns - payload_ns) / 1e9")
+
+
+def _insert_rows(conn, count: int, age_seconds: float) -> None:
+    server_ns = int((time.time() - age_seconds) * NS_PER_SECOND)
+    for i in range(count):
+        assert insert_first_case_compact(
+            conn, 0, i, server_ns - 100_000_000, server_ns + i
+        )
+
+
+def _rolled_up_count(conn) -> int:
+    cursor = conn.execute("SELECT sum(count) FROM first_case_rollup_minute")
+    return cursor.fetchone()[0] or 0
+
+
+def _roll_up_and_prune_all(conn) -> None:
+    _insert_rows(conn, 3, age_seconds=7200)
+    assert rollup.rollup_pending_rows(conn) == 3
+    assert rollup.prune_raw_rows(conn, 3600, pause=0) == 3
+    assert conn.execute("SELECT count(*) FROM first_case_compact").fetchone()[0] == 0
+
+
+def test_rows_after_pruning_the_whole_table_are_rolled_up(tmp_path, compact_rollup):
+    conn = sqlite3.connect(tmp_path / "compact.db")
+    create_compact_tables(conn)
+    create_rollup_tables(conn)
+    _roll_up_and_prune_all(conn)
+
+    # New ids must not restart at or below the watermark
+    _insert_rows(conn, 2, age_seconds=0)
+    assert rollup.rollup_pending_rows(conn) == 2
+    assert _rolled_up_count(conn) == 5
+    conn.close()
+
+
+def test_migration_rebuilds_compact_ids_with_autoincrement(tmp_path, compact_rollup):
+    db_file = tmp_path / "compact.db"
+    conn = sqlite3.connect(db_file)
+    # The compact table as created before its id was AUTOINCREMENT
+    create_compact_tables(conn)
+    create_rollup_tables(conn)
+    conn.executescript(
+        """
+        DROP TABLE first_case_compact;
+        CREATE TABLE first_case_compact (
+            id INTEGER PRIMARY KEY,
+            run_id INTEGER NOT NULL DEFAULT 0,
+            iteration INTEGER,
+            payload_ns INTEGER,
+            server_ns INTEGER,
+            client_id INTEGER,
+            topic_id INTEGER,
+            qos INTEGER,
+            broker_ns INTEGER
+        );
+        """
+    )
+    _roll_up_and_prune_all(conn)
+    conn.close()
+
+    migrate_to_compact(db_file=str(db_file))
+
+    conn = sqlite3.connect(db_file)
+    (sql,) = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'first_case_compact'"
+    ).fetchone()
+    assert "AUTOINCREMENT" in sql
+    # Views dropped with the old table are back
+    assert conn.execute("SELECT count(*) FROM first_case_view").fetchone()[0] == 0
+
+    _insert_rows(conn, 2, age_seconds=0)
+    assert rollup.rollup_pending_rows(conn) == 2
+    assert _rolled_up_count(conn) == 5
+    conn.close()
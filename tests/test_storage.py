@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from src.mqtt_latency_test.utils.mmap_log import MmapLogBackend
+from src.mqtt_latency_test.utils.storage import SQLiteBackend, StorageBackend
+
+
+class IncompleteBackend(StorageBackend):
+    """Implements everything except client_stats()."""
+
+    name = "incomplete"
+
+    def insert_first_case(self, **row) -> bool:
+        return True
+
+    def insert_second_case(self, **row) -> bool:
+        return True
+
+    def fetch_first_case(self) -> list:
+        return []
+
+    def latency_stats(self, start=None, end=None) -> dict:
+        return {}
+
+    async def data_version_async(self):
+        return 0
+
+
+def test_backend_missing_a_method_fails_on_creation():
+    with pytest.raises(TypeError, match="client_stats"):
+        IncompleteBackend()
+
+
+def test_backends_implement_the_interface(tmp_path):
+    SQLiteBackend()
+    MmapLogBackend(directory=str(tmp_path)).close()
+
+
+def test_mmap_data_version_moves_on_insert(tmp_path):
+    backend = MmapLogBackend(directory=str(tmp_path))
+    try:
+        before = asyncio.run(backend.data_version_async())
+        assert backend.insert_first_case(1, None, 1.0, None, 1.1, 0.1)
+        after = asyncio.run(backend.data_version_async())
+        assert after != before
+        assert asyncio.run(backend.data_version_async()) == after
+    finally:
+        backend.close()
@@ -0,0 +1,53 @@
+import asyncio
+import json
+
+import pytest
+
+from src.mqtt_latency_test.handlers import handle_webhook
+from src.mqtt_latency_test.handlers.messageHandlers import get_webhook_metadata
+
+from .conftest import webhook_body
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [
+        {"qos": "not-a-number"},
+        {"qos": 7},
+        {"qos": [1]},
+        {"timestamp": "yesterday"},
+        {"publish_received_at": {"ms": 1}},
+        {"clientid": {"nested": True}, "topic": ["a", "b"]},
+    ],
+)
+def test_invalid_metadata_does_not_cost_the_row(fields, database, synced_ntp):
+    body = {**webhook_body(1), **fields}
+
+    result = asyncio.run(handle_webhook("publish", json.dumps(body).encode()))
+
+    assert result["status"] == "success"
+    assert result["database_saved"] is True
+
+
+def test_metadata_is_parsed_defensively():
+    assert get_webhook_metadata(
+        {
+            "clientid": "device-1",
+            "topic": "latency/test",
+            "qos": "1",
+            "publish_received_at": "bad",
+            "timestamp": 1700000000250,
+        }
+    ) == {
+        "clientid": "device-1",
+        "topic": "latency/test",
+        "qos": 1,
+        "broker_timestamp_epoch": 1700000000.25,
+    }
+    assert get_webhook_metadata({"qos": True, "timestamp": float("nan")}) == {
+        "clientid": None,
+        "topic": None,
+        "qos": None,
+        "broker_timestamp_epoch": None,
+    }
+